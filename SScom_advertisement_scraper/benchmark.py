@@ -0,0 +1,298 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import get_response
+import listing_diff
+import listing_store
+import read_response
+
+# Benchmarks for the scraper stages, run with: python benchmark.py [fetch] [read_resp] [compare_resp] [format_resp]
+# [end_to_end] [--sizes 100,10000] [--repeat 3]
+# Everything runs against a local stub server replaying html pages, ss.com is never contacted.
+#
+# Fixtures are kept in FIXTURE_DIR:
+#   ss_<rows>.html, ss_<rows>_next.html: synthetic pages (generated when missing), the next page has 1% of
+#       the listings replaced and 2% with a changed price, like two consecutive runs
+#   recorded.html: a real ss.com page, saved by "python benchmark.py record" and benchmarked when present
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+FIXTURE_SIZES = (100, 10000, 100000)
+RECORDED_FIXTURE = "recorded.html"
+# bs4 needs minutes for the bigger pages, it is only run up to this many rows
+BS4_MAX_ROWS = 10000
+DEFAULT_REPEAT = 3
+
+STUB_PAGE = "<html><body><table><tr id=\"tr_1\"><td>stub</td></tr></table></body></html>".encode('utf-8')
+
+
+class StubSSHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep the connection alive
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this keep-alive clients hit delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # Replays the page set for the path in server.pages, STUB_PAGE for any other path
+        page = self.server.pages.get(self.path.split('?')[0], STUB_PAGE)
+        self.send_response(200)
+        if self.path == '/':
+            self.send_header('Set-Cookie', 'PHPSESSID=stub%d; path=/' % time.monotonic_ns())
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(pages=None):
+    # pages maps url path to the page bytes served for it, can be changed while the server runs
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSSHandler)
+    server.pages = pages if pages is not None else {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def best_of(func, repeat):
+    # Best time of repeat calls in seconds and the result of the last call
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(stage, fixture, seconds, note=''):
+    print(f"{stage:<28} {fixture:<10} {seconds * 1000:12.2f} ms  {note}")
+
+
+SYNTHETIC_ROW = (
+    '<tr id="tr_{id}" style="cursor:pointer"><td class="msga2-o pp6"><input type="checkbox" id="c{id}" value="{id}"></td>'
+    '<td class="msga2 pp0"><a href="/msg/lv/real-estate/flats/riga/centre/{id}.html" id="im{id}"><img src="/img/{id}.th2.jpg" class="isfoto"></a></td>'
+    '<td class="msg2"><div class="d1"><a href="/msg/lv/real-estate/flats/riga/centre/{id}.html" id="dm_{id}" class="am">Pārdod {rooms}-istabu dzīvokli &amp; balkons</a></div></td>'
+    '<td class="msga2-o pp6"><b>Brīvības {street}</b></td><td class="msga2-o pp6">{rooms}</td><td class="msga2-o pp6">{area}</td>'
+    '<td class="msga2-o pp6">{floor}/5</td><td class="msga2-o pp6">Staļina</td><td class="msga2-o pp6">{m2_price} €</td>'
+    '<td class="msga2-o pp6">{price}  €</td></tr>\n'
+)
+
+
+def make_listing_page(row_count, id_offset=0, changed_every=0):
+    # Page layout similar to ss.com: outer layout table with the listing table nested inside.
+    # changed_every > 0 raises the price of every changed_every-th listing.
+    rows = []
+    for i in range(id_offset, id_offset + row_count):
+        area = 40 + i % 60
+        price = 50000 + (i * 137) % 100000
+        if changed_every and i % changed_every == 0:
+            price += 1000
+        rows.append(SYNTHETIC_ROW.format(id=i, rooms=1 + i % 4, street=i % 150, area=area, floor=1 + i % 5,
+                                         m2_price=f"{price // area:,}", price=f"{price:,}"))
+    return ('<html><head><title>SS.com</title></head><body><table id="page_main"><tr><td>'
+            '<div class="top_head">Sludinājumi</div><table id="filter_tbl"><tr id="head_line"><td>Iela</td></tr>'
+            + ''.join(rows) +
+            '</table></td></tr></table><div id="footer">footer</div></body></html>')
+
+
+def fixture_files(row_count):
+    # (old page, next page) of a synthetic fixture, written on first use
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    fname_old = os.path.join(FIXTURE_DIR, f"ss_{row_count}.html")
+    fname_new = os.path.join(FIXTURE_DIR, f"ss_{row_count}_next.html")
+    for fname, page_args in ((fname_old, {}), (fname_new, {'id_offset': row_count // 100, 'changed_every': 50})):
+        if not os.path.exists(fname):
+            with open(fname + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(make_listing_page(row_count, **page_args))
+            os.replace(fname + '.tmp', fname)
+    return fname_old, fname_new
+
+
+def load_fixtures(sizes):
+    # [(fixture name, old page, next page, row count)], the recorded page is compared to itself
+    fixtures = []
+    for row_count in sizes:
+        fname_old, fname_new = fixture_files(row_count)
+        fixtures.append((str(row_count), fname_old, fname_new, row_count))
+    recorded = os.path.join(FIXTURE_DIR, RECORDED_FIXTURE)
+    if os.path.exists(recorded):
+        fixtures.append(('recorded', recorded, recorded, len(read_response.read_resp(recorded))))
+    return fixtures
+
+
+def record_fixture(jobs_fname="jobs_example.json"):
+    # Saves the live page of the first job as the recorded fixture
+    with open(jobs_fname, 'r', encoding='utf-8') as f:
+        job = json.load(f)[0]
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    response = get_response.SSSession().fetch(job['filter'], job['url'])
+    response.raise_for_status()
+    with open(os.path.join(FIXTURE_DIR, RECORDED_FIXTURE), 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    print(f"Recorded {job['url']} to {FIXTURE_DIR}")
+
+
+def fetch_without_session(base_url, payload, request_url):
+    # The way get_ss_resp used to work: a fresh connection and a fresh PHPSESSID for every call
+    phpsessid = requests.get(base_url).cookies.get('PHPSESSID')
+    cookie = f'{get_response.SID_COOKIE}; PHPSESSID={phpsessid}'
+    requests.post(request_url, data=payload, headers={**get_response.HEADERS_POST, 'cookie': cookie})
+    return requests.get(request_url, headers={**get_response.HEADERS_GET, 'Cookie': cookie})
+
+
+def bench_fetch(fixtures, repeat, count=200):
+    # Small pages: connection and session overhead, fixtures: download of the whole page
+    server, base_url = start_stub_server()
+    path = '/lv/real-estate/flats/riga/centre/sell/filter/'
+    request_url = base_url + path
+    payload = {'topt[8][max]': '120000'}
+    ss_session = get_response.SSSession(base_url=base_url)
+    try:
+        def many(func):
+            return lambda: [func() for _ in range(count)]
+
+        seconds, _ = best_of(many(lambda: fetch_without_session(base_url, payload, request_url)), repeat)
+        report("fetch new connection/call", "stub", seconds / count, f"{count / seconds:.0f} fetches/s")
+        seconds, _ = best_of(many(lambda: ss_session.fetch(payload, request_url).content), repeat)
+        report("fetch SSSession pool", "stub", seconds / count, f"{count / seconds:.0f} fetches/s")
+
+        for name, fname_old, _, _ in fixtures:
+            with open(fname_old, 'rb') as f:
+                server.pages[path] = f.read()
+            seconds, size = best_of(lambda: len(ss_session.fetch(payload, request_url).content), repeat)
+            report("fetch", name, seconds, f"{size / seconds / 2 ** 20:.0f} MiB/s")
+    finally:
+        ss_session.close()
+        server.shutdown()
+
+
+def bench_read_resp(fixtures, repeat):
+    for name, fname_old, _, row_count in fixtures:
+        for backend in ('bs4', 'stream'):
+            if backend == 'bs4' and (read_response.BeautifulSoup is None or row_count > BS4_MAX_ROWS):
+                continue
+            seconds, rows = best_of(lambda: read_response.read_resp(fname_old, backend=backend), repeat)
+            report(f"read_resp {backend}", name, seconds, f"{len(rows)} rows")
+
+
+def bench_compare_resp(fixtures, repeat):
+    # compare_resp parses both pages, diff_listings is the comparison alone on parsed rows
+    for name, fname_old, fname_new, _ in fixtures:
+        seconds, diff_rows = best_of(lambda: read_response.compare_resp(fname_old, fname_new), repeat)
+        report("compare_resp", name, seconds, f"{len(diff_rows)} rows differ")
+        rows_old, rows_new = read_response.read_resp(fname_old), read_response.read_resp(fname_new)
+        seconds, diff = best_of(lambda: listing_diff.diff_listings(rows_old, rows_new), repeat)
+        report("diff_listings", name, seconds,
+               f"{len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed")
+
+
+def bench_format_resp(fixtures, repeat):
+    for name, fname_old, fname_new, _ in fixtures:
+        rows_old, rows_new = read_response.read_resp(fname_old), read_response.read_resp(fname_new)
+        seconds, text = best_of(lambda: read_response.format_resp(rows_new), repeat)
+        report("format_resp all rows", name, seconds, f"{len(text) // 1024} KiB")
+        diff = listing_diff.diff_listings(rows_old, rows_new)
+        seconds, text = best_of(lambda: read_response.format_diff(diff), repeat)
+        report("format_diff", name, seconds, f"{len(text) // 1024} KiB")
+
+
+def run_pipeline(ss_session, payload, request_url, workdir):
+    # Same steps as main.py: fetch, parse the changed page, diff with the store, email text, rotate
+    fname_old = os.path.join(workdir, "SS_response_old.html")
+    fname_new = os.path.join(workdir, "SS_response_new.html")
+    state_file = os.path.join(workdir, get_response.FETCH_STATE_FILE)
+    changed, fetch_state = get_response.get_ss_resp(payload, request_url, fname_old, fname_new, ss_session,
+                                                    state_file)
+    if not changed:
+        get_response.save_fetch_state(state_file, fetch_state)
+        return None
+    store = listing_store.ListingStore(os.path.join(workdir, listing_store.DEFAULT_DB))
+    try:
+        diff = store.diff(read_response.read_resp(fname_new))
+        if not listing_diff.is_empty(diff):
+            store.update(diff)
+            read_response.overwrite_old_resp(fname_old, fname_new)
+            read_response.format_diff(diff)
+    finally:
+        store.close()
+    get_response.save_fetch_state(state_file, fetch_state)
+    return diff
+
+
+def bench_end_to_end(fixtures, repeat):
+    # Every changed run alternates between the old and the next page, so each one has a real diff
+    path = '/lv/real-estate/flats/riga/centre/sell/filter/'
+    server, base_url = start_stub_server()
+    request_url = base_url + path
+    payload = {'topt[8][max]': '120000'}
+    ss_session = get_response.SSSession(base_url=base_url)
+    try:
+        for name, fname_old, fname_new, _ in fixtures:
+            pages = []
+            for fname in (fname_old, fname_new):
+                with open(fname, 'rb') as f:
+                    pages.append(f.read())
+            workdir = tempfile.mkdtemp(prefix="ss_bench_")
+            try:
+                server.pages[path] = pages[0]
+                run_pipeline(ss_session, payload, request_url, workdir)
+                turn = [0]
+
+                def changed_run():
+                    turn[0] += 1
+                    server.pages[path] = pages[turn[0] % 2]
+                    return run_pipeline(ss_session, payload, request_url, workdir)
+
+                seconds, _ = best_of(changed_run, repeat)
+                report("end_to_end changed page", name, seconds)
+                seconds, _ = best_of(lambda: run_pipeline(ss_session, payload, request_url, workdir), repeat)
+                report("end_to_end same page", name, seconds)
+            finally:
+                shutil.rmtree(workdir)
+    finally:
+        ss_session.close()
+        server.shutdown()
+
+
+BENCHMARKS = {
+    'fetch': bench_fetch,
+    'read_resp': bench_read_resp,
+    'compare_resp': bench_compare_resp,
+    'format_resp': bench_format_resp,
+    'end_to_end': bench_end_to_end,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SS.com scraper benchmarks")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)}, or record")
+    parser.add_argument('--sizes', default=','.join(map(str, FIXTURE_SIZES)),
+                        help="row counts of the synthetic fixtures, comma separated")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="best of this many runs is reported")
+    parser.add_argument('--clean', action='store_true', help="regenerate the synthetic fixtures")
+    args = parser.parse_args()
+
+    if args.names == ['record']:
+        record_fixture()
+    else:
+        if args.clean:
+            for fname in glob.glob(os.path.join(FIXTURE_DIR, "ss_*.html")):
+                os.remove(fname)
+        fixtures = load_fixtures([int(size) for size in args.sizes.split(',') if size])
+        for name in args.names or BENCHMARKS:
+            BENCHMARKS[name](fixtures, args.repeat)
@@ -0,0 +1,80 @@
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import get_response
+import read_response
+
+# Reads all result pages of a filter, not only the first one.
+# Page count comes from the page links (.../page7.html) of the first page,
+# the other pages are fetched in waves of max_workers pages at a time.
+
+DEFAULT_CRAWL_WORKERS = 4
+
+PAGE_LINK_RE = re.compile(r'href="([^"]*?/page(\d+)\.html)"')
+
+# rows:          merged rows of all fetched pages, each listing once
+# pages_fetched: number of pages read
+# page_count:    number of pages the filter has
+# complete:      False if the crawl stopped early (known listings reached or max_pages), listings
+#                missing from rows may then still be online
+CrawlResult = namedtuple('CrawlResult', ['rows', 'pages_fetched', 'page_count', 'complete'])
+
+
+def find_pages(ss_html, request_url):
+    # Returns (page count, page url template with {page} in place of the number)
+    page_count = 1
+    template = request_url.rstrip('/') + '/page{page}.html'
+    for match in PAGE_LINK_RE.finditer(ss_html):
+        page = int(match.group(2))
+        if page > page_count:
+            page_count = page
+            template = re.sub(r'page\d+\.html$', 'page{page}.html', urljoin(request_url, match.group(1)))
+    return page_count, template
+
+
+def crawl(ss_session, payload, request_url, known_ids=None, max_workers=DEFAULT_CRAWL_WORKERS, timeout=None,
+          max_pages=None, rate_limiter=None):
+    # known_ids: ids of listings already in the stored snapshot, crawl stops after the wave
+    # of pages where the first of them shows up (pages are ordered newest first)
+    # timeout: seconds for the whole crawl, all pages included
+    deadline = get_response.fetch_deadline(timeout)
+    known_ids = known_ids or ()
+    merged = {}
+
+    def merge(rows):
+        reached_known = False
+        for row in rows:
+            key = read_response.listing_id(row)
+            merged.setdefault(key, row)
+            reached_known = reached_known or key in known_ids
+        return reached_known
+
+    # The filter lives in the PHP session, nobody else may change it until all pages are read
+    with ss_session.url_lock(request_url, deadline):
+        response = ss_session.fetch(payload, request_url, stream=True, deadline=deadline, rate_limiter=rate_limiter)
+        with response:
+            first_html = get_response.read_text(response, deadline)
+        page_count, template = find_pages(first_html, request_url)
+        # Pages read at most; complete still compares with all pages of the filter
+        last_page = page_count if max_pages is None else min(page_count, max_pages)
+        reached_known = merge(read_response.parse_resp(first_html))
+        pages_fetched = 1
+
+        def fetch_page(page):
+            with ss_session.get_page(template.format(page=page), stream=True, deadline=deadline,
+                                     rate_limiter=rate_limiter) as response:
+                return read_response.parse_resp(get_response.read_text(response, deadline))
+
+        pending = list(range(2, last_page + 1))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending and not reached_known:
+                wave = pending[:max_workers]
+                pending = pending[max_workers:]
+                # map keeps page order, so rows stay newest first
+                for rows in executor.map(fetch_page, wave):
+                    reached_known = merge(rows) or reached_known
+                pages_fetched += len(wave)
+
+    return CrawlResult(list(merged.values()), pages_fetched, page_count, pages_fetched == page_count)
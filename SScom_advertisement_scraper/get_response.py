@@ -1,62 +1,314 @@
+import codecs
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+SS_BASE_URL = 'https://www.ss.com'
+
+# PHP drops idle sessions after ~24 minutes, reuse the PHPSESSID for a bit less than that
+# when the cookie itself does not say when it expires
+SESSION_ID_TTL = 20 * 60
+
+# ETag/Last-Modified and body digest of the last fetch of every request url
+FETCH_STATE_FILE = "SS_fetch_state.json"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+SID_COOKIE = 'LG=lv; sid_c=1; sid=afde21d4090be532ac719cf86f3d4c670e351cd88a4f6c40be2d85dea40263c7f61fbd77aa4f585487d92d18d7c39876'
+
+HEADERS_POST = {
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'accept-encoding': 'gzip, deflate, br',
+    'accept-language': 'en-US,en;q=0.9,lv;q=0.8',
+    'cache-control': 'max-age=0',
+    'content-type': 'application/x-www-form-urlencoded',
+    'origin': 'https://www.ss.com',
+    'referer': 'https://www.ss.com/lv/real-estate/flats/riga/centre/sell/filter/',
+    'sec-ch-ua': '"Chromium";v="110", "Not A(Brand";v="24", "Microsoft Edge";v="110"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': 'Windows',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'same-origin',
+    'sec-fetch-user': '?1',
+    'upgrade-insecure-requests': '1',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.57'
+}
+
+HEADERS_GET = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'en-US,en;q=0.9,lv;q=0.8',
+    'Cache-Control': 'max-age=0',
+    'DNT': '1',
+    'Referer': 'https://www.ss.com/lv/real-estate/flats/riga/centre/sell/filter/',
+    'Sec-Ch-Ua': '"Chromium";v="110", "Not A(Brand";v="24", "Microsoft Edge";v="110"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-Fetch-User': '?1',
+    'Upgrade-Insecure-Requests': '1',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.57'
+}
+
+
+def time_left(deadline, what):
+    # Seconds until deadline (time.monotonic() based, None for no deadline), requests.Timeout once it passed
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise requests.Timeout("Deadline passed " + what)
+    return left
+
+
+def fetch_deadline(timeout):
+    return None if timeout is None else time.monotonic() + timeout
+
+
+class SSSession:
+    # Keep-alive connection pool + cached PHPSESSID, so repeated filter fetches
+    # don't pay for a new TCP/TLS handshake and a homepage request every time
+
+    def __init__(self, base_url=SS_BASE_URL, pool_size=10, session_ttl=SESSION_ID_TTL, rate_limiter=None):
+        self.base_url = base_url
+        self.session_ttl = session_ttl
+        # Optional object with wait(url), called before every request
+        self.rate_limiter = rate_limiter
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self._phpsessid = None
+        self._phpsessid_expires = 0
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    def _request(self, method, url, deadline=None, rate_limiter=None, **kwargs):
+        # rate_limiter replaces the session's own one for this request
+        rate_limiter = rate_limiter or self.rate_limiter
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+        timeout = time_left(deadline, "before " + method + " " + url)
+        return self.http.request(method, url, timeout=timeout, **kwargs)
+
+    @contextlib.contextmanager
+    def url_lock(self, request_url, deadline=None):
+        # Held while the filter of request_url is set in the PHP session and its pages are read,
+        # waiting for it counts against the deadline
+        with self._lock:
+            lock = self._url_locks.setdefault(request_url, threading.RLock())
+        timeout = time_left(deadline, "waiting for " + request_url)
+        if not lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise requests.Timeout("Deadline passed waiting for " + request_url)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def get_phpsessid(self, deadline=None):
+        with self._lock:
+            now = time.time()
+            if self._phpsessid is None or now >= self._phpsessid_expires:
+                response = self._request('GET', self.base_url, deadline)
+                cookie = next((c for c in response.cookies if c.name == 'PHPSESSID'), None)
+                if cookie is None:
+                    raise RuntimeError("No PHPSESSID cookie received from " + self.base_url)
+                self._phpsessid = cookie.value
+                expires = now + self.session_ttl
+                if cookie.expires is not None:
+                    expires = min(expires, cookie.expires)
+                self._phpsessid_expires = expires
+                logger.debug("New PHP sessionID: %s", self._phpsessid)
+            return self._phpsessid
+
+    def invalidate(self):
+        # Forget the cached PHPSESSID, next fetch gets a fresh one
+        with self._lock:
+            self._phpsessid = None
+
+    def cookie_header(self, deadline=None):
+        return f'{SID_COOKIE}; PHPSESSID={self.get_phpsessid(deadline)}'
+
+    def fetch(self, payload, request_url, timeout=None, headers=None, stream=False, deadline=None,
+              rate_limiter=None):
+        # POST stores the filter in the PHP session, GET with the same session returns filtered page.
+        # timeout is the budget in seconds for the whole fetch, not for each request; deadline
+        # (time.monotonic()) replaces it when the caller's budget started earlier. With stream the body
+        # is still to be read, read_text/stream_response keep to the same deadline.
+        # headers are added to the GET, e.g. conditional request headers.
+        if deadline is None:
+            deadline = fetch_deadline(timeout)
+        cookie = self.cookie_header(deadline)
+        # Filter is kept per session, two fetches of the same URL must not interleave their POST and GET
+        with self.url_lock(request_url, deadline):
+            self._request('POST', request_url, deadline, rate_limiter, data=payload,
+                          headers={**HEADERS_POST, 'cookie': cookie})
+            return self._request('GET', request_url, deadline, rate_limiter, stream=stream,
+                                 headers={**HEADERS_GET, 'Cookie': cookie, **(headers or {})})
+
+    def get_page(self, page_url, timeout=None, stream=False, deadline=None, rate_limiter=None):
+        # GET another page of a filter that was already set by fetch()
+        if deadline is None:
+            deadline = fetch_deadline(timeout)
+        cookie = self.cookie_header(deadline)
+        return self._request('GET', page_url, deadline, rate_limiter, stream=stream,
+                             headers={**HEADERS_GET, 'Cookie': cookie})
+
+    def close(self):
+        self.http.close()
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session():
+    # One SSSession per process, shared by all filter fetches
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = SSSession()
+        return _shared_session
+
+
+def load_fetch_state(fname):
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fetch_state(fname, state):
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_fname, fname)
+
+
+def iter_body(response, deadline=None):
+    # Decoded body chunks of a stream=True response. A socket read only waits as long as the request's
+    # timeout, the deadline is checked between chunks so a slowly trickling body can't outlast it.
+    # read1 returns whatever has arrived, iter_content (urllib3 < 2.3) waits for a whole chunk.
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        chunks = response.iter_content(DOWNLOAD_CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: read1(DOWNLOAD_CHUNK_SIZE, decode_content=True), b'')
+    for chunk in chunks:
+        time_left(deadline, "while reading " + response.url)
+        yield chunk
+
+
+def read_text(response, deadline=None):
+    # response.text of a stream=True response, read within the deadline
+    body = b''.join(iter_body(response, deadline))
+    return body.decode(response.encoding or 'utf-8', errors='replace')
+
+
+def stream_response(response, fname=None, compression=None, digest=None, parser=None, deadline=None):
+    # Reads the body chunk by chunk, never holding all of it in memory:
+    #   fname:  decoded text is written there (compressed, see snapshots.open_snapshot)
+    #   digest: hashlib object updated with the raw body bytes
+    #   parser: object with feed(text), e.g. listing_parser.ListingParser
+    # Returns the number of body bytes read, raises requests.Timeout if the deadline passes meanwhile.
+    size = 0
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    f = snapshots.open_snapshot(fname, 'wt', compression) if fname else None
+    try:
+        for chunk in iter_body(response, deadline):
+            size += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            text = decoder.decode(chunk)
+            if f is not None:
+                f.write(text)
+            if parser is not None and text:
+                parser.feed(text)
+        text = decoder.decode(b'', final=True)
+        if f is not None:
+            f.write(text)
+        if parser is not None:
+            parser.feed(text)
+            parser.close()
+    finally:
+        if f is not None:
+            f.close()
+    return size
+
+
+def fetch_if_changed(ss_session, payload, request_url, fname_new, url_state, timeout=None, parser=None,
+                     filter_name=None, rate_limiter=None):
+    # Conditional GET with the validators from url_state, otherwise compare the sha256 of the body
+    # with the digest of the last fetch. Writes fname_new and returns True only if the page changed,
+    # url_state (dict with etag/last_modified/digest) is updated in place. Pass a copy and keep it only
+    # once the page was parsed and diffed: with the new validators stored a failed run never sees
+    # the change again.
+    # parser (e.g. listing_parser.ListingParser) gets the body while it is downloaded.
+    # filter_name labels the metrics of this fetch, request_url by default.
+    # timeout covers the whole fetch including the body download.
+    deadline = fetch_deadline(timeout)
+    filter_name = filter_name or request_url
+    conditional_headers = {}
+    if url_state.get('etag'):
+        conditional_headers['If-None-Match'] = url_state['etag']
+    if url_state.get('last_modified'):
+        conditional_headers['If-Modified-Since'] = url_state['last_modified']
+
+    with metrics.timer('ss_fetch_seconds', filter=filter_name):
+        response = ss_session.fetch(payload, request_url, headers=conditional_headers, stream=True, deadline=deadline,
+                                    rate_limiter=rate_limiter)
+        with response:
+            if response.status_code == 304:
+                logger.info("Page not modified: %s", request_url)
+                metrics.inc('ss_fetch_unchanged_total', filter=filter_name)
+                return False
+
+            # Hash the body as it arrives, write it to a temporary file next to fname_new
+            digest = hashlib.sha256()
+            tmp_fname = fname_new + '.part'
+            size = stream_response(response, tmp_fname, snapshots.snapshot_compression(fname_new), digest, parser,
+                                   deadline)
+            metrics.inc('ss_fetch_bytes_total', size, filter=filter_name)
+
+            url_state['etag'] = response.headers.get('ETag')
+            url_state['last_modified'] = response.headers.get('Last-Modified')
+
+    if digest.hexdigest() == url_state.get('digest') and os.path.exists(fname_new):
+        os.remove(tmp_fname)
+        logger.info("Page content unchanged: %s", request_url)
+        metrics.inc('ss_fetch_unchanged_total', filter=filter_name)
+        return False
+    os.replace(tmp_fname, fname_new)
+    url_state['digest'] = digest.hexdigest()
+    return True
+
+
+def get_ss_resp(payload, request_url, fname_old, fname_new, ss_session=None, state_file=FETCH_STATE_FILE):
+    # Returns (changed, fetch_state): changed is True if a changed page was written to fname_new, False if
+    # it is the same as last time. fetch_state has the new validators, save it with save_fetch_state
+    # after the page was processed.
+    logger.debug("Old file name: %s", fname_old)
+    logger.debug("New file name: %s", fname_new)
+    logger.debug("Request URL: %s", request_url)
 
+    if ss_session is None:
+        ss_session = get_shared_session()
 
-def get_ss_resp(payload, request_url, fname_old, fname_new):
-    # Debug
-    print("New file name: " + fname_old)
-    print("Old file name: " + fname_new)
-    print("Request URL: " + request_url)
-
-    # Get the value of the PHPSESSID cookie from the response headers
-    response = requests.get('https://www.ss.com')
-    phpsessid = response.cookies.get('PHPSESSID')
-    print("New PHP sessionID: " + phpsessid)
-
-    # Should get new sid?
-    # sid_data = response.cookies.get
-    # print(sid_data)
-
-    headers_post = {
-        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'accept-encoding': 'gzip, deflate, br',
-        'accept-language': 'en-US,en;q=0.9,lv;q=0.8',
-        'cache-control': 'max-age=0',
-        'content-type': 'application/x-www-form-urlencoded',
-        'cookie': f'LG=lv; sid_c=1; sid=afde21d4090be532ac719cf86f3d4c670e351cd88a4f6c40be2d85dea40263c7f61fbd77aa4f585487d92d18d7c39876; PHPSESSID={phpsessid}',
-        'origin': 'https://www.ss.com',
-        'referer': 'https://www.ss.com/lv/real-estate/flats/riga/centre/sell/filter/',
-        'sec-ch-ua': '"Chromium";v="110", "Not A(Brand";v="24", "Microsoft Edge";v="110"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': 'Windows',
-        'sec-fetch-dest': 'document',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-site': 'same-origin',
-        'sec-fetch-user': '?1',
-        'upgrade-insecure-requests': '1',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.57'
-    }
-    requests.post(request_url, data=payload, headers=headers_post)
-
-    # use the same sessionID to use GET ws
-    headers_get = {
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Accept-Language': 'en-US,en;q=0.9,lv;q=0.8',
-        'Cache-Control': 'max-age=0',
-        'Cookie': f'LG=lv; sid_c=1; sid=afde21d4090be532ac719cf86f3d4c670e351cd88a4f6c40be2d85dea40263c7f61fbd77aa4f585487d92d18d7c39876; PHPSESSID={phpsessid}',
-        'DNT': '1',
-        'Referer': 'https://www.ss.com/lv/real-estate/flats/riga/centre/sell/filter/',
-        'Sec-Ch-Ua': '"Chromium";v="110", "Not A(Brand";v="24", "Microsoft Edge";v="110"',
-        'Sec-Ch-Ua-Mobile': '?0',
-        'Sec-Ch-Ua-Platform': '"Windows"',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'same-origin',
-        'Sec-Fetch-User': '?1',
-        'Upgrade-Insecure-Requests': '1',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.57'
-    }
-    response_get = requests.get(request_url, headers=headers_get)
-    with open(fname_new, 'w', encoding='utf-8') as f:
-        f.write(response_get.text)
-    f.close()
\ No newline at end of file
+    state = load_fetch_state(state_file)
+    url_state = state.setdefault(request_url, {})
+    changed = fetch_if_changed(ss_session, payload, request_url, fname_new, url_state)
+    return changed, state
@@ -0,0 +1,142 @@
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+# Append-only history of advertisements: every run adds one version of every listing it saw.
+# listing_versions keeps all versions (price history, time on market). Two small tables are kept
+# up to date next to it, so queries don't have to read every version:
+#   latest_versions: last seen version of each listing
+#   weekly_prices:   last price of each listing in each week
+
+DEFAULT_DB = "SS_history.db"
+DAY = 24 * 60 * 60
+
+
+def district_from_url(request_url):
+    # /lv/real-estate/flats/riga/centre/sell/filter/ -> centre
+    parts = [part for part in urlsplit(request_url).path.split('/') if part]
+    if 'sell' in parts and parts.index('sell') > 0:
+        return parts[parts.index('sell') - 1]
+    return parts[-1] if parts else ''
+
+
+def week_of(timestamp):
+    return time.strftime('%G-W%V', time.gmtime(timestamp))
+
+
+class HistoryStore:
+
+    def __init__(self, fname=DEFAULT_DB):
+        self.fname = fname
+        self.db = sqlite3.connect(fname)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS listing_versions (
+                listing_id TEXT NOT NULL,
+                seen_at INTEGER NOT NULL,
+                district TEXT NOT NULL,
+                street TEXT,
+                rooms INTEGER,
+                area REAL,
+                floor INTEGER,
+                floors INTEGER,
+                series TEXT,
+                price INTEGER,
+                price_m2 INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_versions_listing ON listing_versions (listing_id, seen_at);
+
+            CREATE TABLE IF NOT EXISTS latest_versions (
+                listing_id TEXT PRIMARY KEY,
+                seen_at INTEGER NOT NULL,
+                district TEXT NOT NULL,
+                street TEXT,
+                rooms INTEGER,
+                area REAL,
+                price INTEGER,
+                price_m2 INTEGER
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_latest_district ON latest_versions (district, price_m2, seen_at);
+
+            CREATE TABLE IF NOT EXISTS weekly_prices (
+                district TEXT NOT NULL,
+                week TEXT NOT NULL,
+                listing_id TEXT NOT NULL,
+                price_m2 INTEGER,
+                PRIMARY KEY (district, week, listing_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_weekly_median ON weekly_prices (district, week, price_m2);
+        """)
+        self.db.commit()
+
+    def record_run(self, listings, district, seen_at=None):
+        # listings are listing.Listing records of one run
+        seen_at = int(time.time() if seen_at is None else seen_at)
+        week = week_of(seen_at)
+        with self.db:
+            self.db.executemany("""
+                INSERT INTO listing_versions
+                    (listing_id, seen_at, district, street, rooms, area, floor, floors, series, price, price_m2)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(item.id, seen_at, district, item.street, item.rooms, item.area, item.floor, item.floors,
+                   item.series, item.price, item.price_m2) for item in listings])
+            self.db.executemany("""
+                INSERT OR REPLACE INTO latest_versions
+                    (listing_id, seen_at, district, street, rooms, area, price, price_m2)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(item.id, seen_at, district, item.street, item.rooms, item.area, item.price, item.price_m2)
+                  for item in listings])
+            self.db.executemany("""
+                INSERT OR REPLACE INTO weekly_prices (district, week, listing_id, price_m2) VALUES (?, ?, ?, ?)
+            """, [(district, week, item.id, item.price_m2) for item in listings])
+
+    def price_history(self, listing_id):
+        # [(seen_at, price, price_m2)], only the versions where the price changed
+        cur = self.db.execute("""
+            SELECT seen_at, price, price_m2 FROM listing_versions WHERE listing_id = ? ORDER BY seen_at
+        """, (listing_id,))
+        history = []
+        for seen_at, price, price_m2 in cur:
+            if not history or history[-1][1] != price:
+                history.append((seen_at, price, price_m2))
+        return history
+
+    def time_on_market(self, listing_id):
+        # Seconds between the first and the last time the listing was seen, None if never seen
+        first, last = self.db.execute("""
+            SELECT MIN(seen_at), MAX(seen_at) FROM listing_versions WHERE listing_id = ?
+        """, (listing_id,)).fetchone()
+        return None if first is None else last - first
+
+    def listings_under(self, district, max_price_m2, days=30, now=None):
+        # Listings of the district seen within the last days with at most max_price_m2,
+        # [(listing_id, street, rooms, area, price, price_m2, seen_at)] cheapest first
+        since = int((time.time() if now is None else now) - days * DAY)
+        cur = self.db.execute("""
+            SELECT listing_id, street, rooms, area, price, price_m2, seen_at
+            FROM latest_versions
+            WHERE district = ? AND price_m2 <= ? AND seen_at >= ?
+            ORDER BY price_m2
+        """, (district, max_price_m2, since))
+        return cur.fetchall()
+
+    def weekly_median_price_m2(self, district):
+        # [(ISO week, median price per m2)] of the district.
+        # Prices of a week are read in order straight from idx_weekly_median, only the middle ones are fetched.
+        weeks = self.db.execute("""
+            SELECT week, COUNT(price_m2) FROM weekly_prices WHERE district = ? GROUP BY week ORDER BY week
+        """, (district,)).fetchall()
+        medians = []
+        for week, count in weeks:
+            if count == 0:
+                continue
+            middle = self.db.execute("""
+                SELECT price_m2 FROM weekly_prices
+                WHERE district = ? AND week = ? AND price_m2 IS NOT NULL
+                ORDER BY price_m2 LIMIT ? OFFSET ?
+            """, (district, week, 2 - count % 2, (count - 1) // 2)).fetchall()
+            medians.append((week, sum(price for price, in middle) / len(middle)))
+        return medians
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,68 @@
+import re
+from dataclasses import dataclass
+
+import read_response
+
+# Typed advertisement record, numbers are parsed once from the row text:
+#   "120,000  €" -> 120000, "54.5" -> 54.5, "3/5" -> floor 3, floors 5
+# Listings are equal and hashed by id (advert link), so they can be put in sets/dicts directly.
+
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+
+
+def parse_int(text):
+    # "120,000  €" -> 120000, None if there is no number
+    match = NUMBER_RE.search(text or '')
+    if match is None:
+        return None
+    return int(re.sub(r'\D', '', match.group()))
+
+
+def parse_float(text):
+    match = NUMBER_RE.search(text or '')
+    if match is None:
+        return None
+    value = match.group()
+    if '.' in value:
+        return float(value.replace(',', ''))
+    return float(value.replace(',', '.'))
+
+
+def parse_floor(text):
+    # "3/5" -> (3, 5), "3" -> (3, None)
+    floor, _, floors = (text or '').partition('/')
+    return parse_int(floor), parse_int(floors)
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Listing:
+    id: str
+    street: str
+    rooms: int | None
+    area: float | None
+    floor: int | None
+    floors: int | None
+    series: str
+    price_m2: int | None
+    price: int | None
+    image: str = ''
+
+    @classmethod
+    def from_row(cls, row):
+        fields = read_response.row_fields(row)
+        floor, floors = parse_floor(fields['floor'])
+        return cls(id=fields['link'], street=fields['street'], rooms=parse_int(fields['rooms']),
+                   area=parse_float(fields['area']), floor=floor, floors=floors, series=fields['series'],
+                   price_m2=parse_int(fields['price_m2']), price=parse_int(fields['price']), image=fields['image'])
+
+    def __eq__(self, other):
+        if not isinstance(other, Listing):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def from_rows(rows):
+    return [Listing.from_row(row) for row in rows]
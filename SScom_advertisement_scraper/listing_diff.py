@@ -0,0 +1,65 @@
+from collections import namedtuple
+
+import metrics
+import read_response
+
+# Diff of two listing snapshots, rows matched by listing id (advert link) with one hash join:
+#   added:   rows of listings that are new
+#   removed: rows of listings that are gone
+#   changed: ListingChange for listings present in both with different values
+
+ListingDiff = namedtuple('ListingDiff', ['added', 'removed', 'changed'])
+# deltas maps field name (read_response.ROW_FIELDS) to (old value, new value)
+ListingChange = namedtuple('ListingChange', ['old', 'new', 'deltas'])
+
+
+def index_rows(rows):
+    return {read_response.listing_id(row): row for row in rows}
+
+
+def row_deltas(old_row, new_row):
+    deltas = {}
+    for i in range(max(len(old_row), len(new_row))):
+        old_value = old_row[i] if i < len(old_row) else None
+        new_value = new_row[i] if i < len(new_row) else None
+        if old_value != new_value:
+            field = read_response.ROW_FIELDS[i] if i < len(read_response.ROW_FIELDS) else str(i)
+            deltas[field] = (old_value, new_value)
+    return deltas
+
+
+def diff_listings(old, new_rows, complete=True):
+    # old is either a list of rows or an already indexed {listing id: row} dict (e.g. ListingStore.load).
+    # complete=False means new_rows are only a part of the listings (crawl stopped early),
+    # old listings missing from them are then not reported as removed.
+    remaining = dict(old) if isinstance(old, dict) else index_rows(old)
+    added = []
+    changed = []
+    for row in new_rows:
+        old_row = remaining.pop(read_response.listing_id(row), None)
+        if old_row is None:
+            added.append(row)
+        elif old_row != row:
+            changed.append(ListingChange(old_row, row, row_deltas(old_row, row)))
+    removed = list(remaining.values()) if complete else []
+    return ListingDiff(added, removed, changed)
+
+
+def apply_diff(index, diff):
+    # Updates a {listing id: row} index in place
+    for row in diff.removed:
+        index.pop(read_response.listing_id(row), None)
+    for row in diff.added:
+        index[read_response.listing_id(row)] = row
+    for change in diff.changed:
+        index[read_response.listing_id(change.new)] = change.new
+    return index
+
+
+def record_metrics(diff, filter_name):
+    for kind in ListingDiff._fields:
+        metrics.set_gauge('ss_diff_listings', len(getattr(diff, kind)), filter=filter_name, kind=kind)
+
+
+def is_empty(diff):
+    return not (diff.added or diff.removed or diff.changed)
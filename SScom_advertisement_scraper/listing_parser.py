@@ -0,0 +1,96 @@
+from html.parser import HTMLParser
+
+import snapshots
+
+# Streaming replacement for the BeautifulSoup part of read_response.read_resp.
+# Gives the same rows (first <table> of the page, every <tr id="tr_..."> in it,
+# href of the first <a> of a cell or else the cell text) without building a tree,
+# and stops reading as soon as that first table is closed.
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ListingParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.done = False
+        self._table_depth = 0
+        self._row = None
+        # Cells of the current row that are not closed yet (nested cells are possible)
+        self._open_cells = []
+
+    def feed(self, data):
+        # Everything after the listing table is skipped
+        if not self.done:
+            super().feed(data)
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'table':
+            self._table_depth += 1
+        elif self._table_depth == 0:
+            return
+        elif tag == 'tr':
+            if self._row is None:
+                row_id = dict(attrs).get('id')
+                if row_id is not None and row_id.startswith('tr_'):
+                    self._row = []
+        elif self._row is None:
+            return
+        elif tag == 'td':
+            cell = {'href': None, 'has_link': False, 'text': []}
+            self._row.append(cell)
+            self._open_cells.append(cell)
+        elif tag == 'a':
+            for cell in self._open_cells:
+                if not cell['has_link']:
+                    cell['has_link'] = True
+                    cell['href'] = dict(attrs).get('href')
+
+    def handle_endtag(self, tag):
+        if self.done or self._table_depth == 0:
+            return
+        if tag == 'td':
+            if self._open_cells:
+                self._open_cells.pop()
+        elif tag == 'tr':
+            self._finish_row()
+        elif tag == 'table':
+            self._finish_row()
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self.done = True
+
+    def handle_data(self, data):
+        for cell in self._open_cells:
+            cell['text'].append(data)
+
+    def _finish_row(self):
+        if self._row is None:
+            return
+        self.rows.append([cell['href'] if cell['has_link'] else ''.join(cell['text']).strip()
+                          for cell in self._row])
+        self._row = None
+        self._open_cells = []
+
+
+def parse_rows(ss_html):
+    parser = ListingParser()
+    parser.feed(ss_html)
+    parser.close()
+    return parser.rows
+
+
+def read_rows(fname):
+    parser = ListingParser()
+    with snapshots.open_snapshot(fname) as f:
+        while not parser.done:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+    return parser.rows
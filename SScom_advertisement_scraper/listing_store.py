@@ -0,0 +1,59 @@
+import json
+import sqlite3
+
+import listing_diff
+import read_response
+
+# Parsed rows of the last run, kept in SQLite so the old html snapshot
+# doesn't have to be parsed again on every run.
+# Rows are stored per snapshot name (one per filter/job), keyed by listing id.
+
+DEFAULT_DB = "SS_listings.db"
+DEFAULT_SNAPSHOT = "default"
+
+
+class ListingStore:
+
+    def __init__(self, fname=DEFAULT_DB):
+        self.fname = fname
+        self.db = sqlite3.connect(fname)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                snapshot TEXT NOT NULL,
+                listing_id TEXT NOT NULL,
+                row TEXT NOT NULL,
+                PRIMARY KEY (snapshot, listing_id)
+            ) WITHOUT ROWID
+        """)
+        self.db.commit()
+
+    def is_empty(self, snapshot=DEFAULT_SNAPSHOT):
+        cur = self.db.execute("SELECT 1 FROM listings WHERE snapshot = ? LIMIT 1", (snapshot,))
+        return cur.fetchone() is None
+
+    def load(self, snapshot=DEFAULT_SNAPSHOT):
+        cur = self.db.execute("SELECT listing_id, row FROM listings WHERE snapshot = ?", (snapshot,))
+        return {key: json.loads(row) for key, row in cur}
+
+    def diff(self, rows, snapshot=DEFAULT_SNAPSHOT):
+        return listing_diff.diff_listings(self.load(snapshot), rows)
+
+    def update(self, diff, snapshot=DEFAULT_SNAPSHOT):
+        # Apply a listing_diff.ListingDiff from diff(): only the affected listings are written
+        upserts = diff.added + [change.new for change in diff.changed]
+        with self.db:
+            self.db.executemany("DELETE FROM listings WHERE snapshot = ? AND listing_id = ?",
+                                [(snapshot, read_response.listing_id(row)) for row in diff.removed])
+            self.db.executemany("INSERT OR REPLACE INTO listings (snapshot, listing_id, row) VALUES (?, ?, ?)",
+                                [(snapshot, read_response.listing_id(row), json.dumps(row, ensure_ascii=False))
+                                 for row in upserts])
+
+    def replace(self, rows, snapshot=DEFAULT_SNAPSHOT):
+        with self.db:
+            self.db.execute("DELETE FROM listings WHERE snapshot = ?", (snapshot,))
+            self.db.executemany("INSERT OR REPLACE INTO listings (snapshot, listing_id, row) VALUES (?, ?, ?)",
+                                [(snapshot, read_response.listing_id(row), json.dumps(row, ensure_ascii=False))
+                                 for row in rows])
+
+    def close(self):
+        self.db.close()
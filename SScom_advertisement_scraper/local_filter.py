@@ -0,0 +1,140 @@
+import bisect
+import re
+
+import listing
+
+# Local evaluation of ss.com filters: jobs on the same url that differ only in their ranges
+# (price, rooms, area, floor) are fetched once with the broadest payload that covers all of them,
+# then every job's own filter is applied to the parsed listings in memory.
+#
+# Range keys of the filter payload (see filter_conds in main.py) -> listing.Listing attribute
+RANGE_KEYS = {
+    'topt[8]': 'price',
+    'topt[1]': 'rooms',
+    'topt[3]': 'area',
+    'topt[4]': 'floor',
+}
+# Optional "local_filter" of a job, conditions ss.com filters can't express:
+#   street_regex: regex searched in the street
+#   series:       list of allowed house series
+#   price_m2:     [min, max], null for no limit
+
+
+def _number(text):
+    return None if text in (None, '') else float(text)
+
+
+def payload_ranges(payload):
+    # {attribute: (min, max)} of the range keys that are set
+    ranges = {}
+    for key, attr in RANGE_KEYS.items():
+        low, high = _number(payload.get(f'{key}[min]')), _number(payload.get(f'{key}[max]'))
+        if low is not None or high is not None:
+            ranges[attr] = (low, high)
+    return ranges
+
+
+def compile_filter(payload, local_filter=None):
+    # Returns a predicate Listing -> bool. Listings without a value for a limited field don't match.
+    checks = list(payload_ranges(payload).items())
+    local_filter = local_filter or {}
+    if local_filter.get('price_m2'):
+        low, high = local_filter['price_m2']
+        checks.append(('price_m2', (low, high)))
+    street_re = re.compile(local_filter['street_regex']) if local_filter.get('street_regex') else None
+    series = frozenset(local_filter['series']) if local_filter.get('series') else None
+
+    def predicate(item):
+        for attr, (low, high) in checks:
+            value = getattr(item, attr)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        if street_re is not None and not street_re.search(item.street):
+            return False
+        if series is not None and item.series not in series:
+            return False
+        return True
+
+    return predicate
+
+
+def group_key(job):
+    # Jobs with the same url, the same non-range payload and the same page mode can share one fetch
+    range_keys = {f'{key}[{end}]' for key in RANGE_KEYS for end in ('min', 'max')}
+    rest = tuple(sorted((key, value) for key, value in job['filter'].items() if key not in range_keys))
+    return job['url'], rest, bool(job.get('all_pages'))
+
+
+def plan_fetches(jobs):
+    # [(fetch job, jobs filtered locally from its rows)], jobs is None when the fetch job is the job itself.
+    # A shared fetch job isn't saved to a file, fname of the grouped jobs is ignored.
+    groups = {}
+    for job in jobs:
+        groups.setdefault(group_key(job), []).append(job)
+    plans = []
+    for group in groups.values():
+        if len(group) == 1 and not group[0].get('local_filter'):
+            plans.append((group[0], None))
+            continue
+        fetch_job = {
+            'name': '+'.join(job['name'] for job in group),
+            'url': group[0]['url'],
+            'filter': broaden([job['filter'] for job in group]),
+            'all_pages': bool(group[0].get('all_pages')),
+        }
+        timeouts = [job['timeout'] for job in group if 'timeout' in job]
+        if timeouts:
+            fetch_job['timeout'] = max(timeouts)
+        plans.append((fetch_job, group))
+    return plans
+
+
+def broaden(payloads):
+    # Smallest payload whose result contains the results of all payloads
+    broad = dict(payloads[0])
+    for key in RANGE_KEYS:
+        lows = [payload.get(f'{key}[min]', '') for payload in payloads]
+        highs = [payload.get(f'{key}[max]', '') for payload in payloads]
+        broad[f'{key}[min]'] = '' if '' in lows else min(lows, key=float)
+        broad[f'{key}[max]'] = '' if '' in highs else max(highs, key=float)
+    return broad
+
+
+class PriceIndex:
+    # Listings sorted by price, a filter with a price range only looks at the listings inside it
+
+    def __init__(self, listings):
+        priced = sorted((item for item in listings if item.price is not None), key=lambda item: item.price)
+        self.prices = [item.price for item in priced]
+        self.listings = priced
+        self.unpriced = [item for item in listings if item.price is None]
+
+    def candidates(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.prices, low)
+        end = len(self.prices) if high is None else bisect.bisect_right(self.prices, high)
+        return self.listings[start:end]
+
+
+def evaluate(listings, filters):
+    # filters: {name: (payload, local_filter)}, returns {name: [matching listings]}
+    index = PriceIndex(listings)
+    results = {}
+    for name, (payload, local_filter) in filters.items():
+        predicate = compile_filter(payload, local_filter)
+        low, high = payload_ranges(payload).get('price', (None, None))
+        if low is None and high is None:
+            candidates = index.listings + index.unpriced
+        else:
+            candidates = index.candidates(low, high)
+        results[name] = [item for item in candidates if predicate(item)]
+    return results
+
+
+def filter_rows(rows, jobs):
+    # Same as evaluate, but on read_resp rows and jobs; returns {job name: rows} in page order
+    listings = listing.from_rows(rows)
+    # By object, ids of rows without a link aren't unique
+    position = {id(item): index for index, item in enumerate(listings)}
+    matched = evaluate(listings, {job['name']: (job['filter'], job.get('local_filter')) for job in jobs})
+    return {name: [rows[index] for index in sorted(position[id(item)] for item in items)]
+            for name, items in matched.items()}
@@ -1,10 +1,30 @@
+import logging
+import os
+
 import get_response
+import history_store
+import listing
+import listing_diff
+import listing_store
+import metrics
+import notifier
 import read_response
-# import send_email
+import repost_index
+
+metrics.setup_logging()
+logger = logging.getLogger("main")
 
 # Define file names where data will be stored
 fname_old = "SS_response_old.html"
 fname_new = "SS_response_new.html"
+# Parsed advertisements of the last run
+fname_db = listing_store.DEFAULT_DB
+# All versions of the advertisements seen so far
+fname_history = history_store.DEFAULT_DB
+# Listings seen so far by street/rooms/floor/series, to recognize re-posted advertisements
+fname_reposts = repost_index.DEFAULT_DB
+# Timings and sizes of this run in Prometheus text format
+fname_metrics = metrics.DEFAULT_TEXTFILE
 
 # Define request url - can change locations - centre, other cities etc.
 request_url = "https://www.ss.com/lv/real-estate/flats/riga/centre/sell/filter/"
@@ -32,29 +52,64 @@ filter_conds = {
     'opt[11]': ''
 }
 
-# Gets html response
-get_response.get_ss_resp(filter_conds, request_url, fname_old, fname_new)
+# Gets html response, parsing and comparing is skipped if the page is the same as on the last run
+page_changed, fetch_state = get_response.get_ss_resp(filter_conds, request_url, fname_old, fname_new)
+
+store = listing_store.ListingStore(fname_db)
+# listing.Listing records of the current advertisements, parsed once and shared by the re-post index
+# and the history
+listings = None
+if not page_changed:
+    logger.info("Page has not changed. Nothing to be done.")
+else:
+    if store.is_empty() and os.path.exists(fname_old):
+        # First run with the listing store - old html snapshot is the baseline
+        store.replace(read_response.read_resp(fname_old))
+
+    # Parse only the new page, compare it to the stored advertisements in one pass
+    with metrics.timer('ss_parse_seconds', filter=request_url):
+        rows_new = read_response.read_resp(fname_new)
+    metrics.set_gauge('ss_rows_extracted', len(rows_new), filter=request_url)
+    diff = store.diff(rows_new)
+    listing_diff.record_metrics(diff, request_url)
+    listings = listing.from_rows(rows_new)
 
-# Compare old to new
-diff_data = read_response.compare_resp(fname_old, fname_new)
+    # Re-posted advertisements are kept in the store but not reported
+    reposts = repost_index.RepostIndex(fname_reposts)
+    report = reposts.drop_reposts(diff, listings, request_url)
+    reposts.close()
 
-# Compare new to old
-if len(diff_data) == 0:
-    diff_data = read_response.compare_resp(fname_new, fname_old)
-    if len(diff_data) == 0:
+    if listing_diff.is_empty(report):
         send_notifs = read_response.resp_handler("none")
     else:
-        send_notifs = read_response.resp_handler("removed")
-else:
-    send_notifs = read_response.resp_handler("added")
-
-if send_notifs == 1:
-    read_response.overwrite_old_resp(fname_old, fname_new)
-    print(diff_data)
-    email_payload = read_response.format_resp(diff_data)
-    print(email_payload)
-    # send email_payload to email
-else:
-    print("Nothing to be done. End program.")
+        for advert in ("added", "changed", "removed"):
+            if len(getattr(report, advert)) > 0:
+                send_notifs = read_response.resp_handler(advert)
+
+    if not listing_diff.is_empty(diff):
+        store.update(diff)
+        read_response.overwrite_old_resp(fname_old, fname_new)
+    if send_notifs == 1:
+        logger.debug("%s", report)
+        email_payload = read_response.format_diff(report)
+        logger.info("%s", email_payload)
+        # Send notifications if sinks are configured (see notify_example.json)
+        if os.path.exists(notifier.NOTIFY_CONFIG_FILE):
+            notifs = notifier.Notifier(notifier.load_sinks(), digest_window=0)
+            notifs.notify(request_url, report)
+            notifs.close()
+    else:
+        logger.info("Nothing to be done.")
+
+# Validators of this fetch are kept only now, if anything above failed the next run diffs the page again
+get_response.save_fetch_state(get_response.FETCH_STATE_FILE, fetch_state)
 
-# email send - NOT FINISHED
+# Every run adds the current advertisements to the history
+history = history_store.HistoryStore(fname_history)
+if listings is None:
+    listings = listing.from_rows(store.load().values())
+history.record_run(listings, history_store.district_from_url(request_url))
+history.close()
+store.close()
+metrics.REGISTRY.write_textfile(fname_metrics)
+logger.info("End program.")
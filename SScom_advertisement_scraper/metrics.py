@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Small in-process metrics registry with Prometheus text format output.
+# Counters and gauges keep one value per label set, summaries keep count/sum/max.
+# Output either as a textfile (for node_exporter's textfile collector, used by one-shot main.py)
+# or from a local /metrics http endpoint (used by the watcher).
+
+DEFAULT_TEXTFILE = "SS_metrics.prom"
+DEFAULT_HTTP_PORT = 9108
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+METRIC_HELP = {
+    'ss_fetch_seconds': ('summary', "Time to fetch a filter page, including the download"),
+    'ss_fetch_bytes_total': ('counter', "Bytes of page bodies downloaded"),
+    'ss_fetch_unchanged_total': ('counter', "Fetches skipped because the page did not change"),
+    'ss_parse_seconds': ('summary', "Time to extract the listing rows of a page"),
+    'ss_rows_extracted': ('gauge', "Listing rows extracted from the last page"),
+    'ss_diff_listings': ('gauge', "Listings in the last non-empty diff, by kind"),
+    'ss_reposts_total': ('counter', "New listings recognized as re-posts and not reported"),
+    'ss_notify_seconds': ('summary', "Time to send a notification digest, by sink"),
+    'ss_notify_failures_total': ('counter', "Failed notification attempts, by sink"),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._summaries = {}
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            count, total, maximum = series.get(_label_key(labels), (0, 0.0, value))
+            series[_label_key(labels)] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            names = sorted(set(self._values) | set(self._summaries))
+            for name in names:
+                kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                for key, (count, total, maximum) in sorted(self._summaries.get(name, {}).items()):
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{name}{_format_labels(key, [('quantile', '1')])} {maximum}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, fname=DEFAULT_TEXTFILE):
+        # Written to a temporary file and renamed, collectors never read half a file
+        tmp_fname = fname + '.tmp'
+        with open(tmp_fname, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_fname, fname)
+
+    def start_http_server(self, port=DEFAULT_HTTP_PORT, host='127.0.0.1'):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+def setup_logging(level=logging.INFO):
+    # Logging setup for the scraper entry points (main.py, watcher.py, scrape_engine.py)
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+# Registry shared by the whole scraper
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
@@ -0,0 +1,161 @@
+import json
+import logging
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import requests
+
+import metrics
+import read_response
+
+# Notification stage: diffs are put on a queue and a background thread sends them,
+# so a slow mail server or webhook never blocks the scraping.
+# Diffs arriving within digest_window seconds of each other go out as one digest,
+# every sink gets the digest with retries.
+
+DEFAULT_DIGEST_WINDOW = 60
+DEFAULT_MAX_RETRIES = 3
+# Delay before the first retry, doubled for each next one
+DEFAULT_RETRY_DELAY = 2
+NOTIFY_CONFIG_FILE = "notify.json"
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class FileSink:
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def send(self, subject, body):
+        with open(self.fname, 'a', encoding='utf-8') as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {subject}\n\n{body}\n")
+
+
+class SMTPSink:
+
+    def __init__(self, host, port, sender, recipients, username=None, password=None, starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message['Subject'] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class WebhookSink:
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, subject, body):
+        response = requests.post(self.url, json={'subject': subject, 'text': body}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+SINK_TYPES = {
+    'file': FileSink,
+    'smtp': SMTPSink,
+    'webhook': WebhookSink,
+}
+
+
+def load_sinks(fname=NOTIFY_CONFIG_FILE):
+    # Config is a list of {"type": "file"/"smtp"/"webhook", ...arguments of the sink}, see notify_example.json
+    with open(fname, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return [SINK_TYPES[entry.pop('type')](**entry) for entry in config]
+
+
+def render_digest(digest):
+    # digest is a list of (job name, listing_diff.ListingDiff)
+    added = sum(len(diff.added) for _, diff in digest)
+    changed = sum(len(diff.changed) for _, diff in digest)
+    removed = sum(len(diff.removed) for _, diff in digest)
+    subject = f"ss.com: {added} new, {changed} changed, {removed} removed advertisements"
+    body = "".join(f"##### {name} #####\n\n" + read_response.format_diff(diff) for name, diff in digest)
+    return subject, body
+
+
+class Notifier:
+
+    def __init__(self, sinks, digest_window=DEFAULT_DIGEST_WINDOW, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        self.sinks = sinks
+        self.digest_window = digest_window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, name="notifier", daemon=True)
+        self.thread.start()
+
+    def notify(self, name, diff):
+        # Same signature as watcher.Watcher on_diff
+        self.queue.put((name, diff))
+
+    def close(self):
+        # Sends what is still queued and stops the worker
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def _worker(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            digest = [item]
+            window_end = time.monotonic() + self.digest_window
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0, window_end - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                digest.append(item)
+            # A digest that can't be rendered or sent is dropped, the worker keeps serving later ones
+            try:
+                self._send(*render_digest(digest))
+            except Exception:
+                logger.exception("Notification digest of %d diffs dropped", len(digest))
+
+    def _send(self, subject, body):
+        for sink in self.sinks:
+            sink_name = type(sink).__name__
+            delay = self.retry_delay
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with metrics.timer('ss_notify_seconds', sink=sink_name):
+                        sink.send(subject, body)
+                    break
+                except Exception as e:
+                    metrics.inc('ss_notify_failures_total', sink=sink_name)
+                    logger.warning("Notification to %s failed (attempt %d): %r", sink_name, attempt + 1, e)
+                    if attempt == self.max_retries:
+                        logger.error("Giving up on %s, digest dropped", sink_name)
+                    else:
+                        time.sleep(delay)
+                        delay *= 2
@@ -1,13 +1,45 @@
-from bs4 import BeautifulSoup
+import logging
 
+import listing_parser
+import snapshots
 
-def read_resp(fname):
-    file_new_html = open(fname, 'r', encoding='utf-8')
-    ss_new = file_new_html.read()
-    file_new_html.close()
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+logger = logging.getLogger(__name__)
+
+# Which parser reads the listing table:
+# 'stream' - listing_parser.ListingParser, reads the file in chunks and keeps only the rows
+# 'bs4'    - builds the full BeautifulSoup tree, slower but kept as a fallback
+PARSER_BACKEND = 'stream'
+
+# How many replaced old snapshots overwrite_old_resp keeps in snapshots/, and if they are gzipped
+SNAPSHOT_KEEP = 0
+SNAPSHOT_COMPRESS = False
+
+
+def read_resp(fname, backend=None):
+    if (backend or PARSER_BACKEND) == 'stream':
+        return listing_parser.read_rows(fname)
+    with snapshots.open_snapshot(fname) as file_new_html:
+        ss_new = file_new_html.read()
+    return parse_resp_bs4(ss_new)
+
+
+def parse_resp(ss_html, backend=None):
+    if (backend or PARSER_BACKEND) == 'stream':
+        return listing_parser.parse_rows(ss_html)
+    return parse_resp_bs4(ss_html)
+
+
+def parse_resp_bs4(ss_html):
+    if BeautifulSoup is None:
+        raise RuntimeError("beautifulsoup4 is not installed, use the 'stream' parser backend")
 
     # Parse the HTML content using BeautifulSoup
-    soup = BeautifulSoup(ss_new, 'html.parser')
+    soup = BeautifulSoup(ss_html, 'html.parser')
 
     # Find the table element in the HTML
     table = soup.find('table')
@@ -32,13 +64,22 @@ def read_resp(fname):
     return data
 
 
+# Column names of the rows returned by read_resp
+ROW_FIELDS = ('select', 'image', 'link', 'street', 'rooms', 'area', 'floor', 'series', 'price_m2', 'price')
+
+
+def listing_id(row):
+    # Link of the advertisement (3rd column) identifies the listing, fall back to the whole row
+    if len(row) > 2 and row[2]:
+        return row[2]
+    return '|'.join(row)
+
+
 def compare_resp(fname_old, fname_new):
     data_old = read_resp(fname_old)
     data_new = read_resp(fname_new)
 
-    print("Compare resp data: ")
-    print(data_old)
-    print(data_new)
+    logger.debug("Compare resp data: %s %s", data_old, data_new)
 
     old_set = set(tuple(row) for row in data_old)
     new_set = set(tuple(row) for row in data_new)
@@ -47,44 +88,84 @@ def compare_resp(fname_old, fname_new):
     return diff_list
 
 
-def overwrite_old_resp(fname_old, fname_new):
-    print("Overwriting file " + fname_old)
-    with open(fname_old, 'w', encoding='utf-8') as f_old, open(fname_new, 'r', encoding='utf-8') as f_new:
-        f_new_content = f_new.read()
-        f_old.write(f_new_content)
-    f_old.close()
-    f_new.close()
+def overwrite_old_resp(fname_old, fname_new, keep=SNAPSHOT_KEEP, compress=SNAPSHOT_COMPRESS):
+    # Atomic, no bytes are copied - see snapshots.rotate_snapshot
+    logger.info("Overwriting file %s", fname_old)
+    snapshots.rotate_snapshot(fname_old, fname_new, keep, compress)
 
 
 def resp_handler(advert):
     if advert == "added":
-        print("Found new advertisement!")
+        logger.info("Found new advertisement!")
         return 1
     if advert == "none":
-        print("No new advertisements added! No notifications will be sent")
+        logger.info("No new advertisements added! No notifications will be sent")
         return 0
     if advert == "removed":
-        print("An advertisement has been removed!")
+        logger.info("An advertisement has been removed!")
+        return 1
+    if advert == "changed":
+        logger.info("An advertisement has been changed!")
         return 1
-    print("Something went horribly wrong...")
+    logger.error("Something went horribly wrong... unknown advert state %r", advert)
     return 0
 
 
+# Email text of one advertisement, filled by field name (ROW_FIELDS) from row_fields
+ADVERT_TEMPLATE = (
+    "Advertisement link: https://www.ss.com{link}\n"
+    "Street: {street}\n"
+    "Room count: {rooms}\n"
+    "Area: {area} m2\n"
+    "Floor: {floor}\n"
+    "House model: {series}\n"
+    "Price for m2: {price_m2}\n"
+    "Total price: {price}\n"
+    "================================\n\n"
+)
+
+# Labels of the fields used in the email text
+FIELD_LABELS = {
+    'street': "Street",
+    'rooms': "Room count",
+    'area': "Area",
+    'floor': "Floor",
+    'series': "House model",
+    'price_m2': "Price for m2",
+    'price': "Total price",
+}
+
+
+def row_fields(row):
+    # {field name: cell text} of a read_resp row, shorter rows (e.g. tr_bnr_ banner rows) get empty values
+    return dict(zip(ROW_FIELDS, list(row) + [''] * (len(ROW_FIELDS) - len(row))))
+
+
 def format_resp(diff_data):
-    counter = 0
-    while len(diff_data) > counter:
-        if counter == 0:
-            email_payload = "Advertisement link: https://www.ss.com" + diff_data[counter][2] + "\n"
-        else:
-            email_payload += "Advertisement link: https://www.ss.com" + diff_data[counter][2] + "\n"
-        email_payload += "Street: " + diff_data[counter][3] + "\n"
-        email_payload += "Room count: " + diff_data[counter][4] + "\n"
-        email_payload += "Area: " + diff_data[counter][5] + " m2\n"
-        email_payload += "Floor: " + diff_data[counter][6] + "\n"
-        email_payload += "House model: " + diff_data[counter][7] + "\n"
-        email_payload += "Price for m2: " + diff_data[counter][8] + "\n"
-        email_payload += "Total price: " + diff_data[counter][9] + "\n"
-        email_payload += "================================\n\n"
-        counter += 1
-    print("Advertisement count added to email: ", counter)
+    email_payload = "".join(ADVERT_TEMPLATE.format_map(row_fields(row)) for row in diff_data)
+    logger.debug("Advertisement count added to email: %d", len(diff_data))
     return email_payload
+
+
+def format_change(change):
+    lines = ["Changed advertisement: https://www.ss.com" + row_fields(change.new)['link'] + "\n"]
+    lines.extend(f"{FIELD_LABELS[field]}: {old_value} -> {new_value}\n"
+                 for field, (old_value, new_value) in change.deltas.items() if field in FIELD_LABELS)
+    lines.append("================================\n\n")
+    return "".join(lines)
+
+
+def format_changes(changes):
+    # changes are listing_diff.ListingChange, one block per advertisement with old -> new values
+    email_payload = "".join(format_change(change) for change in changes)
+    logger.debug("Changed advertisement count added to email: %d", len(changes))
+    return email_payload
+
+
+def format_diff(diff):
+    # Whole email text of a listing_diff.ListingDiff
+    parts = [format_resp(diff.added), format_changes(diff.changed)]
+    if len(diff.removed) > 0:
+        parts.append("Removed advertisements:\n\n")
+        parts.append(format_resp(diff.removed))
+    return "".join(parts)
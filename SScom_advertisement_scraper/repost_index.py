@@ -0,0 +1,110 @@
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+
+import listing
+import listing_diff
+import metrics
+import read_response
+
+# Recognizes re-posted advertisements: sellers delete a flat and post it again under a new link,
+# which the diff reports as a new listing. Every listing seen is indexed by a blocking key of its
+# normalized street, rooms, floor and series; a new listing with the key of an earlier listing that
+# is not online anymore and about the same area is a re-post. A lookup reads one index range, never
+# compares all listings.
+
+DEFAULT_DB = "SS_reposts.db"
+DAY = 24 * 60 * 60
+# Listings seen longer ago than this are not matched anymore
+DEFAULT_MAX_AGE_DAYS = 90
+# Areas within this many m2 are the same flat (sellers round the area differently)
+AREA_TOLERANCE = 1.0
+# Street type words left out of the key, "Brīvības iela 10" is the same as "Brīvības 10"
+STREET_WORDS = {'iela', 'iel', 'prospekts', 'pr', 'gatve', 'bulvaris', 'bulv', 'laukums', 'krastmala'}
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    # Lower case, no diacritics, only letters and digits
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r'[^a-z0-9]+', ' ', text).split()
+
+
+def blocking_key(item):
+    # None if there is no street, such listings are never matched
+    street = [word for word in normalize_text(item.street) if word not in STREET_WORDS]
+    if not street:
+        return None
+    return '|'.join([' '.join(street), str(item.rooms), str(item.floor), ' '.join(normalize_text(item.series))])
+
+
+class RepostIndex:
+
+    def __init__(self, fname=DEFAULT_DB, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.fname = fname
+        self.max_age = max_age_days * DAY
+        self.db = sqlite3.connect(fname)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS listing_keys (
+                listing_id TEXT PRIMARY KEY,
+                block_key TEXT NOT NULL,
+                area REAL,
+                last_seen INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_listing_keys_block ON listing_keys (block_key, area);
+        """)
+        self.db.commit()
+
+    def find_original(self, item, now=None):
+        # Id of an earlier listing of the same flat that was last seen before now (it is gone),
+        # None if item is not a re-post
+        key = blocking_key(item)
+        if key is None or item.area is None:
+            return None
+        now = int(time.time() if now is None else now)
+        found = self.db.execute("""
+            SELECT listing_id FROM listing_keys
+            WHERE block_key = ? AND area BETWEEN ? AND ? AND listing_id != ? AND last_seen >= ? AND last_seen < ?
+            ORDER BY ABS(area - ?) LIMIT 1
+        """, (key, item.area - AREA_TOLERANCE, item.area + AREA_TOLERANCE, item.id, now - self.max_age, now,
+              item.area)).fetchone()
+        return None if found is None else found[0]
+
+    def add(self, listings, seen_at=None):
+        seen_at = int(time.time() if seen_at is None else seen_at)
+        with self.db:
+            self.db.executemany("""
+                INSERT OR REPLACE INTO listing_keys (listing_id, block_key, area, last_seen) VALUES (?, ?, ?, ?)
+            """, [(item.id, key, item.area, seen_at) for item in listings
+                  if item.id and (key := blocking_key(item)) is not None])
+
+    def drop_reposts(self, diff, listings, filter_name='', now=None):
+        # Diff to report: re-posted listings are left out of added, and their originals out of removed.
+        # listings are all current listings (listing.Listing), they are indexed first with last_seen = now,
+        # so a similar flat that is still online is never taken for the original of a new advert.
+        now = int(time.time() if now is None else now)
+        self.add(listings, now)
+        # Added rows are among the listings, their numbers are not parsed again
+        by_id = {item.id: item for item in listings}
+        reposts = {}
+        for row in diff.added:
+            item = by_id.get(read_response.row_fields(row)['link']) or listing.Listing.from_row(row)
+            original = self.find_original(item, now)
+            if original is not None:
+                reposts[read_response.listing_id(row)] = original
+                logger.info("Re-posted advertisement %s (was %s), not reported", row[2], original)
+        if not reposts:
+            return diff
+        metrics.inc('ss_reposts_total', len(reposts), filter=filter_name)
+        originals = set(reposts.values())
+        return listing_diff.ListingDiff(
+            [row for row in diff.added if read_response.listing_id(row) not in reposts],
+            [row for row in diff.removed if read_response.listing_id(row) not in originals],
+            diff.changed)
+
+    def close(self):
+        self.db.close()
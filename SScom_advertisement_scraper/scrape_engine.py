@@ -0,0 +1,140 @@
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import crawler
+import get_response
+import listing_parser
+import local_filter
+import metrics
+import read_response
+import snapshots
+
+# Runs many (URL, filter) jobs at once on a bounded thread pool.
+# Job format (see jobs_example.json):
+#   name:    unique job name, used as key of the results
+#   url:     filter request url
+#   filter:  filter payload, same as filter_conds in main.py
+#   timeout: optional, seconds for the whole fetch of this job
+#   fname:   optional, file where the html response is saved
+#   all_pages: optional, read all result pages instead of the first one (see crawler.py)
+#   local_filter: optional, conditions checked locally on the listings (see local_filter.py)
+# With share_fetches, jobs differing only in their ranges are fetched once with the broadest filter
+# and split locally.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_JOB_TIMEOUT = 30
+# Requests per second allowed for a single host
+DEFAULT_HOST_RATE = 4
+
+
+class HostRateLimiter:
+    # Spaces out requests to the same host, different hosts don't wait for each other
+
+    def __init__(self, default_rate=DEFAULT_HOST_RATE, host_rates=None):
+        self.default_rate = default_rate
+        self.host_rates = host_rates or {}
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).hostname
+        rate = self.host_rates.get(host, self.default_rate)
+        if not rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_jobs(fname):
+    with open(fname, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    names = [job['name'] for job in jobs]
+    if len(names) != len(set(names)):
+        raise ValueError("Job names in " + fname + " are not unique")
+    return jobs
+
+
+def run_job(job, ss_session, default_timeout=DEFAULT_JOB_TIMEOUT, rate_limiter=None):
+    with metrics.timer('ss_fetch_seconds', filter=job['name']):
+        rows = fetch_job_rows(job, ss_session, default_timeout, rate_limiter)
+    metrics.set_gauge('ss_rows_extracted', len(rows), filter=job['name'])
+    return rows
+
+
+def fetch_job_rows(job, ss_session, default_timeout, rate_limiter=None):
+    # The job's timeout covers the wait for the url lock, the requests and reading the body
+    timeout = job.get('timeout', default_timeout)
+    if job.get('all_pages'):
+        return crawler.crawl(ss_session, job['filter'], job['url'], timeout=timeout, rate_limiter=rate_limiter).rows
+    deadline = get_response.fetch_deadline(timeout)
+    response = ss_session.fetch(job['filter'], job['url'], stream=True, deadline=deadline, rate_limiter=rate_limiter)
+    with response:
+        if read_response.PARSER_BACKEND != 'stream':
+            ss_html = get_response.read_text(response, deadline)
+            if job.get('fname'):
+                with snapshots.open_snapshot(job['fname'], 'wt') as f:
+                    f.write(ss_html)
+            return read_response.parse_resp(ss_html)
+        # Parse while downloading, the page is never held in memory as a whole
+        parser = listing_parser.ListingParser()
+        size = get_response.stream_response(response, job.get('fname'), parser=parser, deadline=deadline)
+        metrics.inc('ss_fetch_bytes_total', size, filter=job['name'])
+    return parser.rows
+
+
+def run_jobs(jobs, ss_session=None, max_workers=DEFAULT_MAX_WORKERS, default_timeout=DEFAULT_JOB_TIMEOUT,
+             share_fetches=False, rate_limiter=None):
+    # Returns (results, errors): results maps job name to rows in the read_resp format,
+    # errors maps job name to the exception of every failed job.
+    # Requests are spaced by rate_limiter, the session's own one or else a HostRateLimiter of this run;
+    # the (possibly shared) session is left as it is.
+    if ss_session is None:
+        ss_session = get_response.get_shared_session()
+    rate_limiter = rate_limiter or ss_session.rate_limiter or HostRateLimiter()
+
+    if share_fetches:
+        plans = local_filter.plan_fetches(jobs)
+    else:
+        plans = [(job, [job] if job.get('local_filter') else None) for job in jobs]
+
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(fetch_job, group,
+                    executor.submit(run_job, fetch_job, ss_session, default_timeout, rate_limiter))
+                   for fetch_job, group in plans]
+        for fetch_job, group, future in futures:
+            names = [fetch_job['name']] if group is None else [job['name'] for job in group]
+            try:
+                rows = future.result()
+            except Exception as e:
+                logger.error("Job %s failed: %r", fetch_job['name'], e)
+                errors.update((name, e) for name in names)
+                continue
+            if group is None:
+                results[fetch_job['name']] = rows
+            else:
+                results.update(local_filter.filter_rows(rows, group))
+    return results, errors
+
+
+if __name__ == '__main__':
+    metrics.setup_logging()
+    jobs_fname = sys.argv[1] if len(sys.argv) > 1 else "jobs_example.json"
+    start = time.perf_counter()
+    results, errors = run_jobs(load_jobs(jobs_fname), share_fetches=True)
+    for name, rows in results.items():
+        logger.info("%s: %d advertisements", name, len(rows))
+    logger.info("%d jobs done, %d failed in %.2fs", len(results), len(errors), time.perf_counter() - start)
+    metrics.REGISTRY.write_textfile()
@@ -0,0 +1,81 @@
+import glob
+import gzip
+import os
+import shutil
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Rotation of the html snapshots without copying them.
+# The new snapshot becomes the old one through a hard link and an atomic rename, so the
+# old file is always either the previous or the new complete snapshot, never half written.
+# Optionally the replaced old snapshots are kept in archive_dir (hard links, or gzip files).
+
+DEFAULT_ARCHIVE_DIR = "snapshots"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def snapshot_compression(fname):
+    # Snapshots named *.gz / *.zst are stored compressed
+    if fname.endswith('.gz'):
+        return 'gzip'
+    if fname.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def open_snapshot(fname, mode='rt', compression=None):
+    # Text mode open of a snapshot, compression is taken from the file name if not given
+    compression = compression or snapshot_compression(fname)
+    if compression == 'gzip':
+        return gzip.open(fname, mode, compresslevel=GZIP_LEVEL, encoding='utf-8')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed, can't open " + fname)
+        return zstandard.open(fname, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL), encoding='utf-8')
+    return open(fname, mode, encoding='utf-8')
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # File system without hard links
+        shutil.copy2(src, dst)
+
+
+def archive_snapshot(fname, archive_dir=DEFAULT_ARCHIVE_DIR, keep=5, compress=False):
+    # Keeps fname in archive_dir as <name>.<timestamp><ext>[.gz], at most keep archived files
+    os.makedirs(archive_dir, exist_ok=True)
+    name, ext = os.path.splitext(os.path.basename(fname))
+    archived = os.path.join(archive_dir, f"{name}.{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+    if compress and snapshot_compression(fname) is None:
+        tmp_fname = archived + '.gz.tmp'
+        with open(fname, 'rb') as f_in, gzip.open(tmp_fname, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp_fname, archived + '.gz')
+    else:
+        _link_or_copy(fname, archived)
+
+    # Timestamps sort by name, remove the oldest ones
+    archives = sorted(glob.glob(os.path.join(archive_dir, f"{glob.escape(name)}.*{ext}*")))
+    for old_archive in archives[:-keep] if keep > 0 else archives:
+        os.remove(old_archive)
+
+
+def rotate_snapshot(fname_old, fname_new, keep=0, compress=False, archive_dir=DEFAULT_ARCHIVE_DIR):
+    # fname_old becomes the same file as fname_new, fname_new stays in place.
+    # Both names share the file afterwards, so fname_new must later be replaced (written to another
+    # file and renamed, like get_response.fetch_if_changed does) and never rewritten in place.
+    # keep > 0 archives the replaced fname_old first.
+    if keep > 0 and os.path.exists(fname_old):
+        archive_snapshot(fname_old, archive_dir, keep, compress)
+    tmp_fname = fname_old + '.tmp'
+    if os.path.exists(tmp_fname):
+        os.remove(tmp_fname)
+    _link_or_copy(fname_new, tmp_fname)
+    os.replace(tmp_fname, fname_old)
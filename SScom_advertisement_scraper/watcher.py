@@ -0,0 +1,228 @@
+import heapq
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import crawler
+import get_response
+import history_store
+import listing
+import listing_diff
+import listing_store
+import local_filter
+import metrics
+import notifier
+import read_response
+import repost_index
+import scrape_engine
+
+# Resident mode of the scraper: python watcher.py jobs.json
+# Every job from the jobs file (see scrape_engine.py) is polled on its own interval,
+# connections, fetch validators and parsed listings stay in memory between polls.
+# A job's local_filter is applied to its rows before they are diffed, like in scrape_engine.run_jobs.
+# Optional job keys for the watcher:
+#   interval:     starting poll interval in seconds
+#   min_interval: interval never gets shorter than this
+#   max_interval: interval never gets longer than this
+#   full_crawl_interval: all_pages jobs stop crawling at the first known listing, which never tells
+#                 which listings were removed; at least this often (seconds) all pages are read
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5 * 60
+DEFAULT_MIN_INTERVAL = 60
+DEFAULT_MAX_INTERVAL = 60 * 60
+DEFAULT_FULL_CRAWL_INTERVAL = 60 * 60
+# Interval is multiplied by these after a poll with / without changes
+TIGHTEN_FACTOR = 0.5
+BACKOFF_FACTOR = 1.5
+
+
+class JobState:
+
+    def __init__(self, job, listings):
+        self.job = job
+        self.name = job['name']
+        self.fname = job.get('fname') or f"SS_response_{self.name}.html"
+        self.interval = job.get('interval', DEFAULT_INTERVAL)
+        self.min_interval = job.get('min_interval', DEFAULT_MIN_INTERVAL)
+        self.max_interval = job.get('max_interval', DEFAULT_MAX_INTERVAL)
+        self.full_crawl_interval = job.get('full_crawl_interval', DEFAULT_FULL_CRAWL_INTERVAL)
+        # time.monotonic() of the last crawl that read all pages, None before the first one
+        self.last_full_crawl = None
+        # ETag/Last-Modified/digest for get_response.fetch_if_changed
+        self.url_state = {}
+        # {listing id: row} of the last poll
+        self.listings = listings
+        # False until the job has a stored snapshot, its first poll only becomes the baseline
+        self.seeded = bool(listings)
+        # listing.Listing records of listings, parsed again only when the listings change
+        self.items = listing.from_rows(listings.values())
+
+    def reschedule(self, changed):
+        if changed:
+            self.interval = max(self.min_interval, self.interval * TIGHTEN_FACTOR)
+        else:
+            self.interval = min(self.max_interval, self.interval * BACKOFF_FACTOR)
+        return self.interval
+
+
+def apply_local_filter(job, rows):
+    if not job.get('local_filter'):
+        return rows
+    return local_filter.filter_rows(rows, [job])[job['name']]
+
+
+def poll_job(state, ss_session, rate_limiter=None):
+    # Runs in a worker thread: fetch and parse, returns (rows, complete, url_state), rows is None if the page
+    # didn't change. url_state has the new fetch validators, they replace state.url_state only after the
+    # rows were applied, so the change of a poll that failed later on is fetched again.
+    job = state.job
+    timeout = job.get('timeout', scrape_engine.DEFAULT_JOB_TIMEOUT)
+    if job.get('all_pages'):
+        full = state.last_full_crawl is None or time.monotonic() - state.last_full_crawl >= state.full_crawl_interval
+        with metrics.timer('ss_fetch_seconds', filter=state.name):
+            result = crawler.crawl(ss_session, job['filter'], job['url'], known_ids=None if full else state.listings,
+                                   timeout=timeout, rate_limiter=rate_limiter)
+        metrics.set_gauge('ss_rows_extracted', len(result.rows), filter=state.name)
+        return apply_local_filter(job, result.rows), result.complete, state.url_state
+    url_state = dict(state.url_state)
+    changed = get_response.fetch_if_changed(ss_session, job['filter'], job['url'], state.fname, url_state,
+                                            timeout=timeout, filter_name=state.name, rate_limiter=rate_limiter)
+    if not changed:
+        return None, True, url_state
+    with metrics.timer('ss_parse_seconds', filter=state.name):
+        rows = read_response.read_resp(state.fname)
+    metrics.set_gauge('ss_rows_extracted', len(rows), filter=state.name)
+    return apply_local_filter(job, rows), True, url_state
+
+
+def report_diff(name, diff):
+    logger.info("[%s] %d added, %d changed, %d removed", name, len(diff.added), len(diff.changed), len(diff.removed))
+    logger.info("%s", read_response.format_diff(diff))
+
+
+class Watcher:
+
+    def __init__(self, jobs, ss_session=None, store=None, max_workers=scrape_engine.DEFAULT_MAX_WORKERS,
+                 on_diff=report_diff, history=None, reposts=None, rate_limiter=None):
+        if not jobs:
+            raise ValueError("No jobs to watch")
+        self.ss_session = ss_session or get_response.get_shared_session()
+        # Spaces out the requests of all jobs, the (possibly shared) session is left as it is
+        self.rate_limiter = rate_limiter or self.ss_session.rate_limiter or scrape_engine.HostRateLimiter()
+        self.store = store or listing_store.ListingStore()
+        # Optional history_store.HistoryStore, gets the listings of every successful poll
+        self.history = history
+        # Optional repost_index.RepostIndex, re-posted advertisements are then not passed to on_diff
+        self.reposts = reposts
+        self.max_workers = max_workers
+        # Called with (job name, listing_diff.ListingDiff) when a job's listings changed
+        self.on_diff = on_diff
+        self.states = {job['name']: JobState(job, self.store.load(job['name'])) for job in jobs}
+        self.stop_event = threading.Event()
+
+    def stop(self, signum=None, frame=None):
+        logger.info("Stopping watcher...")
+        self.stop_event.set()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def record_history(self, state):
+        # Every successful poll adds the current listings to the history, changed or not, like every main.py run
+        if self.history is not None:
+            self.history.record_run(state.items, history_store.district_from_url(state.job['url']))
+
+    def seed(self, state, rows):
+        # First poll of a job without a stored snapshot: the current listings become the baseline without
+        # being reported, the same way main.py seeds the store from the old html
+        self.store.replace(rows, state.name)
+        state.listings = {read_response.listing_id(row): row for row in rows}
+        state.items = listing.from_rows(rows)
+        state.seeded = True
+        if self.reposts is not None:
+            self.reposts.add(state.items)
+        logger.info("[%s] %d advertisements stored as the baseline", state.name, len(rows))
+
+    def handle_result(self, state, rows, complete):
+        if not state.seeded:
+            self.seed(state, rows)
+            return False
+        diff = listing_diff.diff_listings(state.listings, rows, complete)
+        if listing_diff.is_empty(diff):
+            return False
+        # Store first: if it fails the listings in memory are still the old ones and the next poll diffs again
+        self.store.update(diff, state.name)
+        listing_diff.apply_diff(state.listings, diff)
+        state.items = listing.from_rows(state.listings.values())
+        listing_diff.record_metrics(diff, state.name)
+        if self.reposts is not None:
+            diff = self.reposts.drop_reposts(diff, state.items, state.name)
+        if not listing_diff.is_empty(diff):
+            self.on_diff(state.name, diff)
+        return True
+
+    def run(self):
+        # Everything is due right away on start
+        now = time.monotonic()
+        schedule = [(now, name) for name in self.states]
+        heapq.heapify(schedule)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self.stop_event.is_set():
+                next_run = schedule[0][0]
+                if self.stop_event.wait(max(0, next_run - time.monotonic())):
+                    break
+
+                # Poll all jobs that are due now, results are applied in this thread
+                now = time.monotonic()
+                due = []
+                while schedule and schedule[0][0] <= now:
+                    due.append(self.states[heapq.heappop(schedule)[1]])
+                futures = [(state, executor.submit(poll_job, state, self.ss_session, self.rate_limiter))
+                           for state in due]
+
+                for state, future in futures:
+                    changed = False
+                    try:
+                        rows, complete, url_state = future.result()
+                        if rows is not None:
+                            changed = self.handle_result(state, rows, complete)
+                            if complete and state.job.get('all_pages'):
+                                state.last_full_crawl = time.monotonic()
+                        self.record_history(state)
+                        state.url_state = url_state
+                    except Exception as e:
+                        logger.error("[%s] poll failed: %r", state.name, e)
+                    interval = state.reschedule(changed)
+                    heapq.heappush(schedule, (time.monotonic() + interval, state.name))
+                    logger.debug("[%s] next poll in %.0fs", state.name, interval)
+
+        self.store.close()
+        if self.history is not None:
+            self.history.close()
+        if self.reposts is not None:
+            self.reposts.close()
+        self.ss_session.close()
+        logger.info("Watcher stopped.")
+
+
+if __name__ == '__main__':
+    metrics.setup_logging()
+    metrics.REGISTRY.start_http_server(metrics.DEFAULT_HTTP_PORT)
+    jobs_fname = sys.argv[1] if len(sys.argv) > 1 else "jobs_example.json"
+    notifs = None
+    if os.path.exists(notifier.NOTIFY_CONFIG_FILE):
+        notifs = notifier.Notifier(notifier.load_sinks())
+    watcher = Watcher(scrape_engine.load_jobs(jobs_fname), on_diff=notifs.notify if notifs else report_diff,
+                      history=history_store.HistoryStore(), reposts=repost_index.RepostIndex())
+    watcher.install_signal_handlers()
+    watcher.run()
+    if notifs:
+        notifs.close()
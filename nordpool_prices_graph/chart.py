@@ -0,0 +1,143 @@
+import functools
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath, text_to_path
+from matplotlib.transforms import Affine2D
+
+# Headless price charts: rendered with the Agg canvas straight into a PNG/SVG buffer, no pyplot and no window.
+# The value labels of a line are one PathCollection instead of a Text artist per point; label paths are
+# put together from cached glyph paths, so a label costs a few array copies instead of a font layout.
+# Charts are cached by a hash of the prices, the same chart is never rendered twice, and a PriceChart
+# can be updated in place when tomorrow's prices arrive.
+
+LABEL_SIZE = 10
+FIGURE_SIZE = (10, 6)
+DPI = 100
+COLORS = {'today': 'b', 'tomorrow': 'r'}
+LEGEND = {'today': "Today's Price", 'tomorrow': "Tomorrow's Price"}
+TITLE = 'Nordpool Electroenergy Prices'
+# Rendered charts kept in memory
+CACHE_SIZE = 64
+
+_FONT = FontProperties(size=LABEL_SIZE)
+
+
+@functools.lru_cache(maxsize=None)
+def _glyph(char):
+    # (vertices, codes, advance width) of one character in points
+    path = TextPath((0, 0), char, prop=_FONT)
+    width = text_to_path.get_text_width_height_descent(char, _FONT, ismath=False)[0]
+    return path.vertices, path.codes, width
+
+
+def label_path(text):
+    # Path of text in points, centered horizontally, bottom at 0 (ha='center', va='bottom')
+    vertices, codes = [], []
+    x = 0.0
+    for char in text:
+        glyph_vertices, glyph_codes, width = _glyph(char)
+        if len(glyph_vertices):
+            vertices.append(glyph_vertices + (x, 0))
+            codes.append(glyph_codes)
+        x += width
+    if not vertices:
+        return Path(np.empty((0, 2)))
+    return Path(np.concatenate(vertices) - (x / 2, 0), np.concatenate(codes))
+
+
+class PriceChart:
+
+    def __init__(self, series, title=TITLE):
+        self.figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.lines = {}
+        self.labels = {}
+        self.hour_ranges = series.hour_ranges()
+        x = np.arange(len(series))
+        for day in COLORS:
+            self.lines[day], = self.ax.plot(x, series.prices(day), marker='o', label=LEGEND[day], color=COLORS[day])
+            # Paths are in points, scaled to pixels at the dpi the figure is drawn with, and placed at the data points
+            self.labels[day] = PathCollection([], offsets=np.empty((0, 2)), offset_transform=self.ax.transData,
+                                              transform=Affine2D().scale(1 / 72) + self.figure.dpi_scale_trans,
+                                              facecolor=COLORS[day], edgecolor='none')
+            self.ax.add_collection(self.labels[day], autolim=False)
+        self.ax.set_xticks(x, self.hour_ranges)
+        self.ax.set_xlabel('Hour Range')
+        self.ax.set_ylabel('Price')
+        self.ax.set_title(title)
+        self.ax.legend(loc='upper right')
+        self.ax.grid(True)
+        self.prices = {}
+        self.update(series)
+
+    def update(self, series):
+        # Only the lines whose prices changed (usually tomorrow's) get new data and labels
+        changed = False
+        for day in COLORS:
+            prices = series.prices(day)
+            if day in self.prices and np.array_equal(prices, self.prices[day], equal_nan=True):
+                continue
+            self.prices[day] = prices.copy()
+            self.lines[day].set_ydata(prices)
+            shown = np.flatnonzero(~np.isnan(prices))
+            self.labels[day].set_paths([label_path(f"{prices[i]:.4f}") for i in shown])
+            self.labels[day].set_offsets(np.column_stack([shown, prices[shown]]) if len(shown) else np.empty((0, 2)))
+            changed = True
+        if changed:
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.figure.tight_layout()
+        return changed
+
+    def render(self, fmt='png'):
+        buffer = io.BytesIO()
+        self.figure.savefig(buffer, format=fmt)
+        return buffer.getvalue()
+
+
+def series_key(series, fmt, title=TITLE):
+    digest = hashlib.sha256()
+    for array in (series.hours, series.today, series.tomorrow):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(f"{fmt}|{title}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ChartCache:
+    # Rendered charts by series_key, least recently used ones are dropped
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, series, fmt='png', title=TITLE):
+        key = series_key(series, fmt, title)
+        with self._lock:
+            if key in self._charts:
+                self._charts.move_to_end(key)
+                return self._charts[key]
+        chart = PriceChart(series, title).render(fmt)
+        with self._lock:
+            self._charts[key] = chart
+            while len(self._charts) > self.size:
+                self._charts.popitem(last=False)
+        return chart
+
+
+CACHE = ChartCache()
+
+
+def render_chart(series, fmt='png', title=TITLE):
+    # PNG/SVG bytes of the chart of a price_series.PriceSeries, from the cache if it was rendered before
+    return CACHE.render(series, fmt, title)
@@ -1,45 +1,28 @@
-import requests
-from bs4 import BeautifulSoup
-import json
-import matplotlib.pyplot as plt
-
-def formatToJson(response):
-    # parse the HTML content using BeautifulSoup
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    # find all the table rows (tr) containing data-hours attribute
-    table_rows = soup.find_all('tr', {'data-hours': True})
+import sys
 
-    # initialize an empty list to store the data in JSON format
-    data_list = []
-
-    # loop through each table row and extract the data
-    for row in table_rows:
-        # extract data from the row
-        hour_range = row.th.text.strip()
-        prices = [float(td.text) for td in row.find_all('td', class_='price')]
-
-        # create a dictionary for each row and add it to the data list
-        data_list.append({
-            'hour_range': hour_range,
-            'today': prices[0],
-            'tomorrow': prices[1]
-        })
+import matplotlib.pyplot as plt
+import numpy as np
 
-    # convert the data_list to JSON format
-    json_data = json.dumps(data_list, indent=2)
-    return json_data
+import chart
+import price_client
+import price_series
 
+def formatToJson(response):
+    # JSON only for output, everything else works on price_series.PriceSeries (see price_client.parse_price_series)
+    return price_client.parse_price_series(response.content).to_json()
 
-def visualizeNordpool(json_data):
-    print(json_data)
 
-    data = json.loads(json_data)
+def visualizeNordpool(series):
+    # series is a price_series.PriceSeries, JSON text in the formatToJson format also works
+    if isinstance(series, str):
+        series = price_series.PriceSeries.from_json(series)
+    for day in price_series.DAYS:
+        print(day, series.summary(day))
 
-    # extracting the hour ranges, today prices, and tomorrow prices
-    hour_ranges = [entry["hour_range"] for entry in data]
-    today_prices = [entry["today"] for entry in data]
-    tomorrow_prices = [entry["tomorrow"] for entry in data]
+    # tomorrow's prices are nan until they are published, not plotted
+    hour_ranges = series.hour_ranges()
+    today_prices = series.today
+    tomorrow_prices = series.tomorrow
 
     # plotting the data as a line plot with connected dots
     plt.figure(figsize=(10, 6))
@@ -57,7 +40,8 @@ def visualizeNordpool(json_data):
     for i, today_price in enumerate(today_prices):
         plt.text(hour_ranges[i], today_price, f"{today_price:.4f}", ha='center', va='bottom', color="b", fontsize=10)
 
-    for i, tomorrow_price in enumerate(tomorrow_prices):
+    for i in np.flatnonzero(~np.isnan(tomorrow_prices)):
+        tomorrow_price = tomorrow_prices[i]
         plt.text(hour_ranges[i], tomorrow_price, f"{tomorrow_price:.4f}", ha='center', va='bottom', color="r", fontsize=10)
 
     plt.tight_layout()
@@ -65,18 +49,19 @@ def visualizeNordpool(json_data):
 
 
 if __name__ == '__main__':
-    url = 'https://nordpool.didnt.work/?vat'
-    nordpool_response = requests.get(url)
-
-    # json_data = formatToJson(nordpool_response)
-
-    # for test purposes, using a given json mock
-    with open('nordpool_data_example.json', 'r', encoding='utf-8') as file:
-        json_data = file.read()
-
-    # Print the JSON data
-    visualizeNordpool(json_data)
-
-
-
-
+    # prices come from the cache when possible, --offline never fetches,
+    # --out chart.png (or .svg) renders the chart to a file without opening a window
+    client = price_client.PriceClient(offline='--offline' in sys.argv)
+    series = client.get_series()
+
+    if series is None:
+        # for test purposes, using a given json mock
+        with open('nordpool_data_example.json', 'r', encoding='utf-8') as file:
+            series = price_series.PriceSeries.from_json(file.read())
+
+    if '--out' in sys.argv:
+        fname = sys.argv[sys.argv.index('--out') + 1]
+        with open(fname, 'wb') as file:
+            file.write(chart.render_chart(series, fmt=fname.rsplit('.', 1)[-1]))
+    else:
+        visualizeNordpool(series)
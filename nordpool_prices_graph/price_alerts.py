@@ -0,0 +1,228 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+import requests
+
+import price_client
+
+# Price alerts: rules fire when a price of an hour is above / below a threshold, or negative.
+# Rules are kept in threshold order per area, so the rules a price triggers are one bisect away:
+#   above t: every rule with t < price, a prefix of the ascending above list
+#   below t: every rule with t > price, a suffix of the ascending below list
+#   negative: a below rule with threshold 0
+# Prices are fed as they arrive, every hour is checked once and a rule fires once per hour.
+# Alerts go to the sinks of alert_sinks.json (log, file, webhook, ntfy push - see alert_sinks_example.json),
+# the hours already checked are kept in SEEN_FILE so the next run doesn't send them again.
+
+# threshold is not used by negative rules
+Rule = namedtuple('Rule', ['name', 'kind', 'threshold', 'area'], defaults=(0.0, None))
+# hours and prices of one rule on one delivery day, in the order they were fed
+Alert = namedtuple('Alert', ['rule', 'area', 'delivery_date', 'hours', 'prices'])
+
+KINDS = ('above', 'below', 'negative')
+ALERT_RULES_FILE = "alert_rules_example.json"
+ALERT_SINKS_FILE = "alert_sinks.json"
+SEEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nordpool_alerts_seen.json")
+
+logger = logging.getLogger(__name__)
+
+
+class ThresholdIndex:
+    # Rules of one area: (threshold, rule) lists in ascending threshold order
+
+    def __init__(self):
+        self.above_thresholds, self.above_rules = [], []
+        self.below_thresholds, self.below_rules = [], []
+
+    def add(self, rule):
+        if rule.kind == 'above':
+            thresholds, rules, threshold = self.above_thresholds, self.above_rules, rule.threshold
+        else:
+            thresholds, rules = self.below_thresholds, self.below_rules
+            threshold = 0.0 if rule.kind == 'negative' else rule.threshold
+        position = bisect.bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        rules.insert(position, rule)
+
+    def matching(self, price):
+        # Rules triggered by price: O(log n) plus the rules returned
+        return (self.above_rules[:bisect.bisect_left(self.above_thresholds, price)]
+                + self.below_rules[bisect.bisect_right(self.below_thresholds, price):])
+
+
+class AlertEngine:
+
+    def __init__(self, rules=()):
+        # Rules without an area apply to every area
+        self.indexes = {}
+        self.any_area = ThresholdIndex()
+        # (area, delivery date, hour) already checked
+        self.seen = set()
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        if rule.kind not in KINDS:
+            raise ValueError(f"Rule {rule.name}: kind must be one of {', '.join(KINDS)}, not {rule.kind!r}")
+        index = self.any_area if rule.area is None else self.indexes.setdefault(rule.area, ThresholdIndex())
+        index.add(rule)
+
+    def feed(self, area, delivery_date, hours, prices):
+        # New price rows of a delivery day (labels and prices, None for no price yet), returns the Alerts
+        # of the hours not checked before, one per rule
+        alerts = {}
+        area_index = self.indexes.get(area)
+        for hour, price in zip(hours, prices):
+            if price is None or price != price or (area, delivery_date, hour) in self.seen:
+                continue
+            self.seen.add((area, delivery_date, hour))
+            rules = self.any_area.matching(price)
+            if area_index is not None:
+                rules += area_index.matching(price)
+            for rule in rules:
+                alert = alerts.setdefault(rule.name, Alert(rule, area, delivery_date, [], []))
+                alert.hours.append(hour)
+                alert.prices.append(price)
+        return list(alerts.values())
+
+    def feed_day(self, area, entry):
+        # A price_client.PriceCache entry
+        return self.feed(area, date.fromisoformat(entry['delivery_date']), entry['hours'], entry['prices'])
+
+    def forget_before(self, delivery_date):
+        # Drops the checked hours of older days, they won't be fed again
+        self.seen = {key for key in self.seen if key[1] >= delivery_date}
+
+    def load_seen(self, fname=SEEN_FILE):
+        try:
+            with open(fname, 'r', encoding='utf-8') as f:
+                self.seen = {(area, date.fromisoformat(day), hour) for area, day, hour in json.load(f)}
+        except FileNotFoundError:
+            self.seen = set()
+
+    def save_seen(self, fname=SEEN_FILE):
+        # Written to a temporary file and renamed like the price cache
+        with open(fname + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(sorted([area, day.isoformat(), hour] for area, day, hour in self.seen), f)
+        os.replace(fname + '.tmp', fname)
+
+
+def format_alert(alert):
+    kind = alert.rule.kind
+    condition = "negative" if kind == 'negative' else f"{kind} {alert.rule.threshold}"
+    hours = ', '.join(f"{hour} ({price:.4f})" for hour, price in zip(alert.hours, alert.prices))
+    return f"[{alert.rule.name}] {alert.area} {alert.delivery_date}: price {condition} at {hours}"
+
+
+class LogSink:
+
+    def send(self, subject, body):
+        logger.info("%s: %s", subject, body)
+
+
+class FileSink:
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def send(self, subject, body):
+        with open(self.fname, 'a', encoding='utf-8') as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {subject}\n{body}\n")
+
+
+class WebhookSink:
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, subject, body):
+        response = requests.post(self.url, json={'subject': subject, 'text': body}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class NtfySink:
+    # Push notification to the phones subscribed to an ntfy topic, url is e.g. https://ntfy.sh/my-prices
+
+    def __init__(self, url, priority='default', timeout=30):
+        self.url = url
+        self.priority = priority
+        self.timeout = timeout
+
+    def send(self, subject, body):
+        response = requests.post(self.url, data=body.encode('utf-8'), timeout=self.timeout,
+                                 headers={'Title': subject.encode('utf-8'), 'Priority': self.priority})
+        response.raise_for_status()
+
+
+SINK_TYPES = {
+    'log': LogSink,
+    'file': FileSink,
+    'webhook': WebhookSink,
+    'ntfy': NtfySink,
+}
+
+
+def load_sinks(fname=ALERT_SINKS_FILE):
+    # List of {"type": "log"/"file"/"webhook"/"ntfy", ...arguments of the sink}, see alert_sinks_example.json
+    with open(fname, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return [SINK_TYPES[entry.pop('type')](**entry) for entry in config]
+
+
+def send_alerts(alerts, sinks):
+    # Every alert to every sink, returns False if a sink failed
+    delivered = True
+    for alert in alerts:
+        subject = f"Price alert {alert.rule.name}"
+        for sink in sinks:
+            try:
+                sink.send(subject, format_alert(alert))
+            except Exception as e:
+                logger.error("Sending %s to %s failed: %r", subject, type(sink).__name__, e)
+                delivered = False
+    return delivered
+
+
+def check_day(engine, clients, delivery_date, sinks, seen_file=SEEN_FILE):
+    # Feeds the prices of the day of every area (clients maps area to price_client.PriceClient) and sends
+    # the alerts. The checked hours are saved only when every sink got its alerts, otherwise the next run
+    # sends them again.
+    engine.load_seen(seen_file)
+    engine.forget_before(delivery_date - timedelta(days=1))
+    checked_before = set(engine.seen)
+    alerts = []
+    for area, client in clients.items():
+        entry = client.get_day(delivery_date)
+        if entry is None:
+            logger.info("No prices for %s %s yet", area, delivery_date)
+            continue
+        alerts += engine.feed_day(area, entry)
+    if send_alerts(alerts, sinks):
+        engine.save_seen(seen_file)
+    else:
+        engine.seen = checked_before
+    return alerts
+
+
+def load_rules(fname=ALERT_RULES_FILE):
+    # List of {"name", "kind": "above"/"below"/"negative", "threshold", "area"}, see alert_rules_example.json
+    with open(fname, 'r', encoding='utf-8') as f:
+        return [Rule(**rule) for rule in json.load(f)]
+
+
+if __name__ == '__main__':
+    # python price_alerts.py [rules.json] [areas] - checks tomorrow's prices against the rules,
+    # alerts go to the sinks of alert_sinks.json (the log without it)
+    logging.basicConfig(level=logging.INFO)
+    engine = AlertEngine(load_rules(sys.argv[1] if len(sys.argv) > 1 else ALERT_RULES_FILE))
+    areas = sys.argv[2].split(',') if len(sys.argv) > 2 else [price_client.DEFAULT_AREA]
+    sinks = load_sinks() if os.path.exists(ALERT_SINKS_FILE) else [LogSink()]
+    tomorrow = price_client.market_today() + timedelta(days=1)
+    check_day(engine, {area: price_client.PriceClient(area=area) for area in areas}, tomorrow, sinks)
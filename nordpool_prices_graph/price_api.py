@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import sys
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import price_client
+import price_series
+import price_store
+
+# Local HTTP/JSON service for the day-ahead prices: python price_api.py [areas] [port]
+#   GET /prices?area=LV&date=2026-10-18      prices of the delivery day
+#   GET /summary?area=LV&date=2026-10-18     min/max/mean, cheapest and most expensive hour
+#   GET /cheapest?area=LV&date=...&hours=3   the 3 cheapest hours and the cheapest 3 hour window
+#   GET /now?area=LV                         price of the current hour
+# area defaults to the first area served, date to today. Every response body of a day is built once,
+# when the day is first asked for, together with its ETag; a request is a dict lookup, clients
+# sending If-None-Match get a 304.
+
+DEFAULT_PORT = 8080
+# Published prices never change, clients may keep them this long without asking
+MAX_AGE = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    return None if value is None or np.isnan(value) else round(float(value), 6)
+
+
+def _response(payload):
+    body = json.dumps(payload).encode('utf-8')
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class DayResponses:
+    # All responses of one area and delivery day, as (body, etag)
+
+    def __init__(self, area, entry):
+        self.area = area
+        self.delivery_date = date.fromisoformat(entry['delivery_date'])
+        series = price_series.PriceSeries.from_days(entry)
+        prices = series.today
+        labels = series.hour_ranges()
+        head = {'area': area, 'date': entry['delivery_date']}
+
+        self.prices = _response({**head, 'hours': labels, 'prices': [_number(price) for price in prices]})
+        summary = series.summary()
+        has_prices = not np.isnan(prices).all()
+        self.summary = _response({
+            **head, **summary,
+            'cheapest_hour': labels[int(np.nanargmin(prices))] if has_prices else None,
+            'most_expensive_hour': labels[int(np.nanargmax(prices))] if has_prices else None,
+        })
+        self.cheapest = {}
+        for k in range(1, len(prices) + 1):
+            window = series.cheapest_window(k)
+            self.cheapest[k] = _response({
+                **head,
+                'hours': [labels[i] for i in series.cheapest_hours(k)],
+                'window': None if window is None else {'start': labels[window[0]], 'mean': _number(window[1])},
+            })
+        # One response per price slot for /now
+        self.day_start, day_end = price_store.delivery_day_bounds(self.delivery_date)
+        self.slot_seconds = (day_end - self.day_start).total_seconds() / max(len(prices), 1)
+        self.now = [_response({**head, 'hour': label, 'price': _number(price)}) for label, price in zip(labels, prices)]
+
+    def current(self, now):
+        slot = int((now - self.day_start).total_seconds() // self.slot_seconds)
+        return self.now[slot] if 0 <= slot < len(self.now) else None
+
+
+class PriceAPI:
+
+    def __init__(self, clients):
+        # clients maps area to price_client.PriceClient
+        self.clients = clients
+        self.default_area = next(iter(clients))
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def day(self, area, delivery_date):
+        # DayResponses of the day, None if its prices are not available (not cached: they may come later)
+        key = (area, delivery_date)
+        responses = self._days.get(key)
+        if responses is None:
+            entry = self.clients[area].get_day(delivery_date)
+            if entry is None:
+                return None
+            responses = DayResponses(area, entry)
+            with self._lock:
+                responses = self._days.setdefault(key, responses)
+        return responses
+
+    def respond(self, path, query):
+        # (status, body, etag) of a request
+        area = query.get('area', [self.default_area])[0]
+        if area not in self.clients:
+            return 404, *_response({'error': f"unknown area {area}"})
+        now = datetime.now(price_client.MARKET_TZ)
+        try:
+            delivery_date = date.fromisoformat(query['date'][0]) if 'date' in query else price_client.market_today(now)
+            hours = int(query.get('hours', ['1'])[0])
+        except ValueError as e:
+            return 400, *_response({'error': str(e)})
+        if path not in ('/prices', '/summary', '/cheapest', '/now'):
+            return 404, *_response({'error': f"unknown path {path}"})
+
+        responses = self.day(area, delivery_date)
+        if responses is None:
+            return 404, *_response({'error': f"no prices for {area} {delivery_date}"})
+        if path == '/prices':
+            return 200, *responses.prices
+        if path == '/summary':
+            return 200, *responses.summary
+        if path == '/cheapest':
+            if hours not in responses.cheapest:
+                return 400, *_response({'error': f"hours must be 1..{len(responses.cheapest)}"})
+            return 200, *responses.cheapest[hours]
+        current = responses.current(now)
+        if current is None:
+            return 404, *_response({'error': "no price for the current hour"})
+        return 200, *current
+
+
+def make_server(api, port=DEFAULT_PORT, host='127.0.0.1'):
+
+    class PriceHandler(BaseHTTPRequestHandler):
+        # Keep-alive, home automation clients poll over the same connection
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, body, etag = api.respond(url.path, parse_qs(url.query))
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 200:
+                self.send_header('ETag', etag)
+                # /now changes every hour
+                self.send_header('Cache-Control', 'no-cache' if url.path == '/now' else f'max-age={MAX_AGE}')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), PriceHandler)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    areas = sys.argv[1].split(',') if len(sys.argv) > 1 else [price_client.DEFAULT_AREA]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+    server = make_server(PriceAPI({area: price_client.PriceClient(area=area) for area in areas}), port)
+    logger.info("Serving %s prices on http://127.0.0.1:%d", ', '.join(areas), port)
+    server.serve_forever()
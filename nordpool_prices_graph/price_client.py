@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import requests
+from bs4 import BeautifulSoup
+
+import price_series
+
+# Day-ahead prices with an on-disk cache, one file per bidding area and delivery day:
+#   <cache_dir>/<area>/<YYYY-MM-DD>.json
+# Prices of a delivery day never change once published, so a cached day is served forever.
+# A day that is not cached is only fetched after its publication time (the day before, PUBLISH_TIME
+# market time), before that the page wouldn't have it yet. The page has today's and tomorrow's
+# prices, one fetch fills both days that are not cached yet.
+
+DEFAULT_URL = 'https://nordpool.didnt.work/?vat'
+DEFAULT_AREA = 'LV'
+# Page with the prices of each bidding area; the page only shows one area, an area without a page here
+# needs its url given explicitly
+AREA_URLS = {
+    'LV': DEFAULT_URL,
+}
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nordpool_cache")
+MARKET_TZ = ZoneInfo('Europe/Oslo')
+# Day-ahead auction results are out around 12:45 CET, a little margin on top
+PUBLISH_TIME = time(13, 0)
+# Publication can be late, a missing day is asked again at most this often
+RETRY_AFTER = timedelta(minutes=15)
+REQUEST_TIMEOUT = 30
+# The page shows no dates and may turn over to the next day at another midnight than the market (its own
+# time zone is an hour ahead), pages fetched this close to market midnight are not cached
+MIDNIGHT_GUARD = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_price_rows(html):
+    # [(hour range, today's price, tomorrow's price)] of the tr[data-hours] rows,
+    # a price is None if the page shows no number (tomorrow before publication)
+    def price(td):
+        try:
+            return float(td.text)
+        except ValueError:
+            return None
+
+    soup = BeautifulSoup(html, 'html.parser')
+    rows = []
+    for row in soup.find_all('tr', {'data-hours': True}):
+        prices = [price(td) for td in row.find_all('td', class_='price')] + [None, None]
+        rows.append((row.th.text.strip(), prices[0], prices[1]))
+    return rows
+
+
+def parse_price_series(html):
+    return price_series.PriceSeries.from_rows(parse_price_rows(html))
+
+
+def publication_time(delivery_date):
+    return datetime.combine(delivery_date - timedelta(days=1), PUBLISH_TIME, MARKET_TZ)
+
+
+def market_today(now=None):
+    return (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ).date()
+
+
+def near_midnight(now):
+    # Differences in UTC, wall clock differences are off on DST days
+    today = market_today(now)
+    start = datetime.combine(today, time(0), MARKET_TZ).astimezone(timezone.utc)
+    end = datetime.combine(today + timedelta(days=1), time(0), MARKET_TZ).astimezone(timezone.utc)
+    now = now.astimezone(timezone.utc)
+    return now - start < MIDNIGHT_GUARD or end - now <= MIDNIGHT_GUARD
+
+
+class PriceCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, area, delivery_date):
+        return os.path.join(self.cache_dir, area, f"{delivery_date.isoformat()}.json")
+
+    def has(self, area, delivery_date):
+        return os.path.exists(self.path(area, delivery_date))
+
+    def get(self, area, delivery_date):
+        # {"hours": [...], "prices": [...], ...} or None if the day is not cached
+        try:
+            with open(self.path(area, delivery_date), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, area, delivery_date, hours, prices, fetched_at=None):
+        fname = self.path(area, delivery_date)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        entry = {
+            'area': area,
+            'delivery_date': delivery_date.isoformat(),
+            'fetched_at': (fetched_at or datetime.now(MARKET_TZ)).isoformat(),
+            'hours': list(hours),
+            'prices': list(prices),
+        }
+        # Written to a temporary file and renamed, readers never see half a day
+        with open(fname + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(fname + '.tmp', fname)
+        return entry
+
+
+class PriceClient:
+
+    def __init__(self, url=None, area=DEFAULT_AREA, cache_dir=DEFAULT_CACHE_DIR, offline=False,
+                 session=None):
+        if url is None:
+            url = AREA_URLS.get(area)
+        if url is None and not offline:
+            raise ValueError(f"No price page known for area {area}, known areas: {', '.join(AREA_URLS)}")
+        self.url = url
+        self.area = area
+        self.cache = PriceCache(cache_dir)
+        # Offline: only the cache is used, nothing is fetched
+        self.offline = offline
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._last_attempt = None
+
+    def fetch_page(self, now=None):
+        # Fetches the page and caches every complete day on it that is not cached yet (a cached day is
+        # final), returns the days newly cached
+        now = now or datetime.now(MARKET_TZ)
+        self._last_attempt = now
+        if near_midnight(now):
+            logger.info("Not fetching %s prices this close to midnight, the page's days are ambiguous", self.area)
+            return []
+        response = self.session.get(self.url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        rows = parse_price_rows(response.content)
+        today = market_today(now)
+        cached = []
+        for column, delivery_date in ((1, today), (2, today + timedelta(days=1))):
+            prices = [row[column] for row in rows]
+            if rows and None not in prices and not self.cache.has(self.area, delivery_date):
+                self.cache.put(self.area, delivery_date, [row[0] for row in rows], prices, now)
+                cached.append(delivery_date)
+        logger.info("Fetched %s prices, cached %s", self.area, ', '.join(map(str, cached)) or "no new day")
+        return cached
+
+    def should_fetch(self, delivery_date, now):
+        if self.offline or now < publication_time(delivery_date):
+            return False
+        # The page only has today and tomorrow
+        if delivery_date < market_today(now):
+            return False
+        return self._last_attempt is None or now - self._last_attempt >= RETRY_AFTER
+
+    def get_day(self, delivery_date, now=None):
+        # Cached entry of the delivery day, fetched if it should be available by now; None if it isn't
+        now = now or datetime.now(MARKET_TZ)
+        entry = self.cache.get(self.area, delivery_date)
+        if entry is not None:
+            return entry
+        with self._lock:
+            # Another thread may have fetched it meanwhile
+            entry = self.cache.get(self.area, delivery_date)
+            if entry is None and self.should_fetch(delivery_date, now):
+                try:
+                    self.fetch_page(now)
+                except requests.RequestException as e:
+                    logger.warning("Fetching %s prices failed: %r", self.area, e)
+                entry = self.cache.get(self.area, delivery_date)
+        return entry
+
+    async def get_day_async(self, delivery_date, now=None):
+        # Same as get_day without blocking the event loop
+        return await asyncio.to_thread(self.get_day, delivery_date, now)
+
+    async def get_days_async(self, delivery_dates, now=None):
+        return await asyncio.gather(*(self.get_day_async(delivery_date, now) for delivery_date in delivery_dates))
+
+    def get_series(self, day=None, now=None):
+        # price_series.PriceSeries of day and the next day, None if day is not available.
+        # Tomorrow's prices are nan until they are published.
+        now = now or datetime.now(MARKET_TZ)
+        day = day or market_today(now)
+        today = self.get_day(day, now)
+        if today is None:
+            return None
+        return price_series.PriceSeries.from_days(today, self.get_day(day + timedelta(days=1), now))
+
+    def get_table(self, day=None, now=None):
+        # Same as get_series, as rows in the formatToJson format
+        series = self.get_series(day, now)
+        return None if series is None else series.to_records()
@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+
+# Prices of today and tomorrow as arrays, one element per hour of the day:
+#   hours:    int array, start hour of every row (0..23)
+#   today:    float array
+#   tomorrow: float array, nan where there is no price yet
+# Everything is computed on the arrays, JSON (the formatToJson list of dicts) is only read/written at the edges.
+
+DAYS = ('today', 'tomorrow')
+
+
+def hour_start(hour_range):
+    # "07-08" -> 7
+    return int(hour_range.split('-')[0])
+
+
+def _prices(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def window_sums(prices, window):
+    # Sum of every window of consecutive prices from prefix sums, element i starts at i;
+    # nan for windows with a missing price
+    if window <= 0 or window > len(prices):
+        return np.empty(0)
+    missing = np.isnan(prices)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(missing, 0.0, prices))])
+    gaps = np.concatenate([[0], np.cumsum(missing)])
+    totals = sums[window:] - sums[:-window]
+    totals[gaps[window:] - gaps[:-window] > 0] = np.nan
+    return totals
+
+
+class PriceSeries:
+    __slots__ = ('hours', 'today', 'tomorrow')
+
+    def __init__(self, hours, today, tomorrow=None):
+        self.hours = np.asarray(hours, dtype=np.int64)
+        self.today = np.asarray(today, dtype=np.float64)
+        self.tomorrow = np.full(len(self.hours), np.nan) if tomorrow is None else np.asarray(tomorrow, dtype=np.float64)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows of price_client.parse_price_rows
+        return cls([hour_start(row[0]) for row in rows], _prices(row[1] for row in rows),
+                   _prices(row[2] for row in rows))
+
+    @classmethod
+    def from_days(cls, today, tomorrow=None):
+        # Cache entries of price_client.PriceCache for two consecutive days
+        return cls([hour_start(hour_range) for hour_range in today['hours']], _prices(today['prices']),
+                   None if tomorrow is None else _prices(tomorrow['prices']))
+
+    @classmethod
+    def from_json(cls, json_data):
+        data = json.loads(json_data)
+        return cls([hour_start(entry['hour_range']) for entry in data], _prices(entry['today'] for entry in data),
+                   _prices(entry['tomorrow'] for entry in data))
+
+    def __len__(self):
+        return len(self.hours)
+
+    def __repr__(self):
+        return f"PriceSeries({len(self)} hours, tomorrow={'yes' if self.has_tomorrow() else 'no'})"
+
+    def hour_ranges(self):
+        # 7 -> "07-08", 23 -> "23-00"
+        return [f"{hour:02d}-{(hour + 1) % 24:02d}" for hour in self.hours.tolist()]
+
+    def has_tomorrow(self):
+        return len(self) > 0 and not np.isnan(self.tomorrow).any()
+
+    def prices(self, day='today'):
+        # 'today', 'tomorrow' or 'both' (today followed by tomorrow)
+        if day == 'both':
+            return np.concatenate([self.today, self.tomorrow])
+        if day not in DAYS:
+            raise ValueError("day must be 'today', 'tomorrow' or 'both', not " + repr(day))
+        return getattr(self, day)
+
+    def summary(self, day='today'):
+        # {'min', 'max', 'mean'} of the day, None values if it has no prices
+        prices = self.prices(day)
+        if np.isnan(prices).all():
+            return {'min': None, 'max': None, 'mean': None}
+        return {'min': float(np.nanmin(prices)), 'max': float(np.nanmax(prices)), 'mean': float(np.nanmean(prices))}
+
+    def cheapest_hours(self, k, day='today'):
+        # Indexes of the k cheapest hours in time order (indexes into prices(day), hours go past 23 for 'both')
+        prices = self.prices(day)
+        k = min(k, int(np.count_nonzero(~np.isnan(prices))))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        # nan sorts last, it is never picked
+        return np.sort(np.argpartition(prices, k - 1)[:k])
+
+    def rolling_mean(self, window, day='today'):
+        # Mean price of every window of consecutive hours, element i starts at hour i; nan where a price is missing
+        return window_sums(self.prices(day), window) / window if window > 0 else np.empty(0)
+
+    def cheapest_window(self, window, day='today'):
+        # (start index, mean price) of the cheapest window of consecutive hours, None if there is none
+        means = self.rolling_mean(window, day)
+        if len(means) == 0 or np.isnan(means).all():
+            return None
+        start = int(np.nanargmin(means))
+        return start, float(means[start])
+
+    def to_records(self):
+        # formatToJson list of dicts, None for missing prices
+        return [{'hour_range': hour_range, 'today': None if np.isnan(today) else today,
+                 'tomorrow': None if np.isnan(tomorrow) else tomorrow}
+                for hour_range, today, tomorrow in zip(self.hour_ranges(), self.today.tolist(), self.tomorrow.tolist())]
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_records(), indent=indent)
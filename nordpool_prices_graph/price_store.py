@@ -0,0 +1,211 @@
+import calendar
+import glob
+import logging
+import os
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+
+import price_client
+import price_series
+
+# Long price history of several bidding areas in compact binary files, one per area and month:
+#   <store_dir>/<area>/<YYYY-MM>.f32
+# Every file is a float32 array with one price per 15 minutes of the (UTC) month, nan where there is
+# no price. Hourly prices fill their four quarters. Files are memory-mapped, a range query only
+# touches the pages of the months and slots it reads.
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nordpool_store")
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+DTYPE = np.float32
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(moment):
+    return month_start(month_start(moment) + timedelta(days=32))
+
+
+def slot_count(start, end):
+    return int((end - start).total_seconds()) // (SLOT_MINUTES * 60)
+
+
+def slot_of(moment):
+    # Index of the 15 minute slot of moment in its month file
+    return slot_count(month_start(moment), moment)
+
+
+def to_utc(moment):
+    if moment.tzinfo is None:
+        raise ValueError("Times of the price store must be timezone aware")
+    return moment.astimezone(timezone.utc)
+
+
+def delivery_day_bounds(delivery_date):
+    # UTC start and end of a delivery day of the market (23/24/25 hours around DST changes)
+    start = datetime.combine(delivery_date, time(0), price_client.MARKET_TZ)
+    end = datetime.combine(delivery_date + timedelta(days=1), time(0), price_client.MARKET_TZ)
+    return to_utc(start), to_utc(end)
+
+
+class PriceStore:
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+
+    def path(self, area, moment):
+        return os.path.join(self.store_dir, area, f"{moment.year:04d}-{moment.month:02d}.f32")
+
+    def _open(self, area, moment, mode):
+        # Memory map of the month file of moment, None when reading a month that doesn't exist
+        fname = self.path(area, moment)
+        slots = calendar.monthrange(moment.year, moment.month)[1] * SLOTS_PER_DAY
+        if not os.path.exists(fname):
+            if mode == 'r':
+                return None
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            np.full(slots, np.nan, dtype=DTYPE).tofile(fname + '.tmp')
+            os.replace(fname + '.tmp', fname)
+        return np.memmap(fname, dtype=DTYPE, mode=mode, shape=(slots,))
+
+    def _month_slices(self, start, end):
+        # (month start, first slot, end slot, position in the result) for every month in [start, end)
+        position = 0
+        moment = start
+        while moment < end:
+            month_end = next_month(moment)
+            first = slot_of(moment)
+            last = slot_count(month_start(moment), min(end, month_end))
+            yield month_start(moment), first, last, position
+            position += last - first
+            moment = month_end
+
+    def write(self, area, start, prices, resolution_minutes=SLOT_MINUTES):
+        # prices from start (timezone aware) on, one every resolution_minutes (a multiple of 15)
+        start = to_utc(start)
+        if resolution_minutes % SLOT_MINUTES:
+            raise ValueError(f"Resolution must be a multiple of {SLOT_MINUTES} minutes")
+        slots = np.repeat(np.asarray(prices, dtype=DTYPE), resolution_minutes // SLOT_MINUTES)
+        end = start + timedelta(minutes=SLOT_MINUTES * len(slots))
+        for moment, first, last, position in self._month_slices(start, end):
+            month = self._open(area, moment, 'r+')
+            month[first:last] = slots[position:position + last - first]
+            month.flush()
+            del month
+
+    def read(self, area, start, end):
+        # float32 prices of [start, end) at 15 minute resolution, nan where nothing is stored
+        start, end = to_utc(start), to_utc(end)
+        result = np.full(max(0, slot_count(start, end)), np.nan, dtype=DTYPE)
+        for moment, first, last, position in self._month_slices(start, end):
+            month = self._open(area, moment, 'r')
+            if month is not None:
+                result[position:position + last - first] = month[first:last]
+                del month
+        return result
+
+    def read_hourly(self, area, start, end):
+        # Hourly means of [start, end), start and end on full hours
+        quarters = self.read(area, start, end)
+        return quarters.reshape(-1, 60 // SLOT_MINUTES).mean(axis=1)
+
+    def read_day(self, area, delivery_date):
+        return self.read(area, *delivery_day_bounds(delivery_date))
+
+    def has_day(self, area, delivery_date):
+        return not np.isnan(self.read_day(area, delivery_date)).all()
+
+    def areas(self):
+        if not os.path.isdir(self.store_dir):
+            return []
+        return sorted(entry.name for entry in os.scandir(self.store_dir) if entry.is_dir())
+
+    def months(self, area):
+        return sorted(os.path.basename(fname)[:-4] for fname in glob.glob(os.path.join(self.store_dir, area, "*.f32")))
+
+
+def label_slots(delivery_date, labels, start, day_slots):
+    # Slot offsets from start of the hour labels ("02-03") of a delivery day in market time, None where
+    # the hour doesn't exist (spring DST change) or was already given (the repeated autumn hour).
+    # None instead of a list if a label has no start hour.
+    offsets = []
+    for label in labels:
+        try:
+            local = datetime.combine(delivery_date, time(price_series.hour_start(label)), price_client.MARKET_TZ)
+        except (AttributeError, ValueError):
+            return None
+        offset = slot_count(start, to_utc(local))
+        if to_utc(local).astimezone(price_client.MARKET_TZ).hour != local.hour or offset in offsets:
+            offset = None
+        elif not 0 <= offset <= day_slots - SLOTS_PER_HOUR:
+            return None
+        offsets.append(offset)
+    return offsets
+
+
+def ingest_day(store, area, entry):
+    # Writes a price_client.PriceCache entry, returns False (logged) if its prices don't fit in the day.
+    # The resolution follows from the number of prices in the day. The page always has 24 hours, on
+    # 23/25 hour DST days they are placed by their labels instead: the missing spring hour is left out,
+    # the repeated autumn hour stays nan.
+    delivery_date = date.fromisoformat(entry['delivery_date'])
+    start, end = delivery_day_bounds(delivery_date)
+    day_minutes = int((end - start).total_seconds()) // 60
+    prices = [np.nan if price is None else price for price in entry['prices']]
+    if prices and day_minutes % len(prices) == 0 and (day_minutes // len(prices)) % SLOT_MINUTES == 0:
+        store.write(area, start, prices, day_minutes // len(prices))
+        return True
+    day_slots = day_minutes // SLOT_MINUTES
+    offsets = label_slots(delivery_date, entry.get('hours') or [], start, day_slots)
+    if not prices or offsets is None or len(offsets) != len(prices):
+        logger.warning("%s %s: %d prices don't fit in the day, skipped", area, delivery_date, len(prices))
+        return False
+    slots = np.full(day_slots, np.nan, dtype=DTYPE)
+    for offset, price in zip(offsets, prices):
+        if offset is not None:
+            slots[offset:offset + SLOTS_PER_HOUR] = price
+    store.write(area, start, slots)
+    return True
+
+
+def ingest(store, clients, start_date, end_date):
+    # Stores every day of [start_date, end_date] not stored yet. clients maps area to a source with
+    # get_day(delivery_date) like price_client.PriceClient; returns {area: days stored}
+    stored = {}
+    for area, client in clients.items():
+        stored[area] = 0
+        day = start_date
+        while day <= end_date:
+            if not store.has_day(area, day):
+                entry = client.get_day(day)
+                if entry is not None and ingest_day(store, area, entry):
+                    stored[area] += 1
+            day += timedelta(days=1)
+    return stored
+
+
+def update(store, clients, days_back=7):
+    # The last days_back days up to tomorrow, for a regular run after publication
+    today = price_client.market_today()
+    return ingest(store, clients, today - timedelta(days=days_back), today + timedelta(days=1))
+
+
+if __name__ == '__main__':
+    # python price_store.py [areas, comma separated] [first day] - backfills from the first day
+    # (or updates the last week) for every area, from the price cache or the page
+    areas = sys.argv[1].split(',') if len(sys.argv) > 1 else [price_client.DEFAULT_AREA]
+    clients = {area: price_client.PriceClient(area=area) for area in areas}
+    store = PriceStore()
+    if len(sys.argv) > 2:
+        stored = ingest(store, clients, date.fromisoformat(sys.argv[2]), price_client.market_today() + timedelta(days=1))
+    else:
+        stored = update(store, clients)
+    for area, days in stored.items():
+        print(f"{area}: {days} days stored")
@@ -0,0 +1,147 @@
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+import price_client
+import price_series
+
+# Picks the cheapest start hours for flexible loads (dishwasher, EV charging, boiler...).
+# prices is an array of hourly prices, usually PriceSeries.prices('both') (today followed by tomorrow),
+# hours without a price (nan) are never used. Hours of a job are indexes into prices:
+#   duration:       hours the job runs without a break
+#   power:          kW the job draws while it runs
+#   earliest_start: first hour it may start
+#   deadline:       hour it has to be done by, None for the end of prices
+# Window costs come from prefix sums of the prices, every window of a job is evaluated at once.
+
+Job = namedtuple('Job', ['name', 'duration', 'power', 'earliest_start', 'deadline'], defaults=(1.0, 0, None))
+# starts maps job name to its start hour (None if it didn't fit), load is the kW drawn in every hour
+Schedule = namedtuple('Schedule', ['starts', 'cost', 'load'])
+
+SCHEDULE_JOBS_FILE = "schedule_jobs_example.json"
+
+
+def job_bounds(job, hour_count):
+    # Range of start hours of the job
+    deadline = hour_count if job.deadline is None else min(job.deadline, hour_count)
+    return max(job.earliest_start, 0), deadline - job.duration + 1
+
+
+def window_costs(prices, duration):
+    # Price sum of every window of duration hours, inf where a price is missing
+    totals = price_series.window_sums(prices, duration)
+    return np.where(np.isnan(totals), np.inf, totals)
+
+
+def best_start(job, prices, totals=None, load=None, power_cap=None):
+    # (start hour, cost) of the cheapest window of a single job, (None, None) if there is none.
+    # totals are window_costs(prices, job.duration) if already known; with power_cap only windows
+    # where load + job.power stays under the cap are used.
+    first, end = job_bounds(job, len(prices))
+    if job.duration <= 0 or end <= first:
+        return None, None
+    if totals is None:
+        totals = window_costs(prices, job.duration)
+    totals = totals[first:end]
+    if power_cap is not None:
+        # Peak load of every window, from the load shifted by 0..duration-1 hours
+        peak = load[first:end].copy()
+        for shift in range(1, job.duration):
+            np.maximum(peak, load[first + shift:end + shift], out=peak)
+        totals = np.where(peak > power_cap - job.power, np.inf, totals)
+    start = int(np.argmin(totals))
+    if np.isinf(totals[start]):
+        return None, None
+    return first + start, float(totals[start]) * job.power
+
+
+def cheapest_starts(jobs, prices):
+    # {job name: start hour or None} of independent jobs (no power cap), all jobs of the same duration
+    # at once: a job x window cost matrix with the windows outside of the job's bounds masked out
+    starts = {}
+    by_duration = {}
+    for job in jobs:
+        by_duration.setdefault(job.duration, []).append(job)
+    for duration, group in by_duration.items():
+        if not 0 < duration <= len(prices):
+            starts.update((job.name, None) for job in group)
+            continue
+        totals = window_costs(prices, duration)
+        bounds = np.array([job_bounds(job, len(prices)) for job in group]).reshape(-1, 2)
+        window = np.arange(len(totals))
+        allowed = (window >= bounds[:, :1]) & (window < bounds[:, 1:])
+        costs = np.where(allowed, totals, np.inf)
+        best = np.argmin(costs, axis=1)
+        found = np.isfinite(costs[np.arange(len(group)), best])
+        starts.update((job.name, int(start) if ok else None) for job, start, ok in zip(group, best, found))
+    return starts
+
+
+def schedule_jobs(jobs, prices, power_cap=None, improve_passes=1):
+    # Greedy: the most constrained jobs are placed first, each in its cheapest window that still fits
+    # under power_cap (kW, None for no cap). Then every job is taken out and put back into its best
+    # window improve_passes times, which fixes most choices the greedy order got wrong.
+    # Without a cap every job simply gets its own cheapest window.
+    prices = np.asarray(prices, dtype=np.float64)
+    load = np.zeros(len(prices))
+    if power_cap is None:
+        starts = cheapest_starts(jobs, prices)
+        for job in jobs:
+            if starts[job.name] is not None:
+                load[starts[job.name]:starts[job.name] + job.duration] += job.power
+        return Schedule(starts, schedule_cost(jobs, starts, prices), load)
+
+    starts = {}
+    # Jobs of the same duration share the window costs
+    costs_by_duration = {}
+
+    def flexibility(job):
+        first, end = job_bounds(job, len(prices))
+        return end - first, -job.duration * job.power
+
+    def place(job):
+        if job.duration not in costs_by_duration and 0 < job.duration <= len(prices):
+            costs_by_duration[job.duration] = window_costs(prices, job.duration)
+        start, _ = best_start(job, prices, costs_by_duration.get(job.duration), load, power_cap)
+        starts[job.name] = start
+        if start is not None:
+            load[start:start + job.duration] += job.power
+
+    ordered = sorted(jobs, key=flexibility)
+    for job in ordered:
+        place(job)
+    for _ in range(improve_passes):
+        for job in ordered:
+            start = starts[job.name]
+            if start is not None:
+                load[start:start + job.duration] -= job.power
+            place(job)
+
+    return Schedule(starts, schedule_cost(jobs, starts, prices), load)
+
+
+def schedule_cost(jobs, starts, prices):
+    return sum(float(np.sum(prices[starts[job.name]:starts[job.name] + job.duration])) * job.power
+               for job in jobs if starts[job.name] is not None)
+
+
+def load_jobs(fname=SCHEDULE_JOBS_FILE):
+    # List of {"name", "duration", "power", "earliest_start", "deadline"}, see schedule_jobs_example.json
+    with open(fname, 'r', encoding='utf-8') as f:
+        return [Job(**job) for job in json.load(f)]
+
+
+if __name__ == '__main__':
+    # python scheduler.py [jobs.json] [power cap kW] - plans the jobs on today's and tomorrow's prices
+    jobs = load_jobs(sys.argv[1] if len(sys.argv) > 1 else SCHEDULE_JOBS_FILE)
+    power_cap = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    series = price_client.PriceClient().get_series()
+    if series is None:
+        sys.exit("No prices available")
+    schedule = schedule_jobs(jobs, series.prices('both'), power_cap)
+    for job in jobs:
+        start = schedule.starts[job.name]
+        print(f"{job.name}: " + ("doesn't fit" if start is None else f"day {start // 24 + 1} {start % 24:02d}:00"))
+    print(f"Total cost: {schedule.cost:.4f}")
@@ -0,0 +1,98 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import socketio
+
+# Checks that chat servers sharing a message queue relay broadcasts to each other:
+# two servers are started on their own ports, a message sent to the first one has to reach a client
+# of the second one. python check_message_queue.py [queue url], CHAT_MESSAGE_QUEUE by default;
+# without either an in-memory Redis stand-in (pip install fakeredis) is started.
+
+# Same as main.MESSAGE_QUEUE_ENV; main isn't imported here, it would create an app connected to the queue
+MESSAGE_QUEUE_ENV = "CHAT_MESSAGE_QUEUE"
+TIMEOUT = 10
+
+# Runs the app without the debug reloader, so terminating the process stops the server
+SERVER_CODE = "import main, sys; main.socketio.run(main.app, port=int(sys.argv[1]), allow_unsafe_werkzeug=True)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake_redis():
+    # fakeredis TCP server in a thread, enough for the pub/sub the message queue uses
+    from fakeredis import TcpFakeServer
+    port = free_port()
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def start_server(port, queue):
+    env = {**os.environ, MESSAGE_QUEUE_ENV: queue}
+    return subprocess.Popen([sys.executable, '-c', SERVER_CODE, str(port)], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for_port(port, deadline):
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def check(queue, ports):
+    servers = [start_server(port, queue) for port in ports]
+    clients = []
+    try:
+        deadline = time.monotonic() + TIMEOUT
+        if not all(wait_for_port(port, deadline) for port in ports):
+            print("Servers did not start")
+            return False
+
+        received = threading.Event()
+        text = f"queue check {uuid.uuid4()}"
+        sender, listener = socketio.Client(), socketio.Client()
+        clients += [sender, listener]
+
+        @listener.on('message')
+        def on_message(message):
+            if message == text:
+                received.set()
+
+        listener.connect(f"http://127.0.0.1:{ports[1]}")
+        sender.connect(f"http://127.0.0.1:{ports[0]}")
+        sender.send(text)
+        return received.wait(TIMEOUT)
+    finally:
+        for client in clients:
+            client.disconnect()
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    queue = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(MESSAGE_QUEUE_ENV)
+    if not queue:
+        try:
+            queue = start_fake_redis()
+        except ImportError:
+            sys.exit(f"Give a queue url or set {MESSAGE_QUEUE_ENV}, or pip install fakeredis for a stand-in")
+    ports = free_port(), free_port()
+    if check(queue, ports):
+        print(f"OK: a message sent to port {ports[0]} reached a client on port {ports[1]} through {queue}")
+    else:
+        sys.exit(f"FAILED: the message did not reach the second server through {queue}")
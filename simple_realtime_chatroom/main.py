@@ -1,8 +1,14 @@
+import os
+
 from flask import Flask, render_template
 from flask_socketio import SocketIO, send
 
+# Message queue shared by all server processes, e.g. redis://localhost:6379/0
+# Without it messages are broadcast only to the clients of this process (single worker).
+MESSAGE_QUEUE_ENV = "CHAT_MESSAGE_QUEUE"
+
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.environ.get(MESSAGE_QUEUE_ENV) or None)
 
 
 @socketio.on("message")
@@ -17,4 +23,4 @@ def message():
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', debug=True, port=8000)
+    socketio.run(app, host='0.0.0.0', debug=True, port=int(os.environ.get("CHAT_PORT", 8000)))